@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .events import notify_user
+from .versions import bump_user_version
+
+
+def get_auth_cache():
+    return caches[settings.AUTH_TOKEN_CACHE]
+
+
+def token_cache_key(key):
+    return f'auth-token:{key}'
+
+
+def user_token_cache_key(user_id):
+    # Reverse index so a user's cached token can be dropped without a query
+    return f'auth-token-user:{user_id}'
+
+
+def user_cache_key(user_id):
+    # Users authenticated by signed (JWT) tokens are cached by id
+    return f'auth-user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    """Drop every cached auth entry for `user_id` and bump its conditional-GET version"""
+    bump_user_version(user_id)
+    cache = get_auth_cache()
+    keys = [user_cache_key(user_id)]
+    key = cache.get(user_token_cache_key(user_id))
+    if key:
+        keys += [token_cache_key(key), user_token_cache_key(user_id)]
+    cache.delete_many(keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that resolves token -> user from the AUTH_TOKEN_CACHE cache.
+
+    Entries expire after AUTH_TOKEN_CACHE_TIMEOUT seconds and are dropped when the
+    user is saved, their token is deleted (logout) or a view changes their row
+    with a queryset UPDATE. Each request gets its own unpickled copy of the user,
+    so in-memory changes in one request never leak into another.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_auth_cache()
+        user = cache.get(token_cache_key(key))
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set_many({
+                token_cache_key(key): user,
+                user_token_cache_key(user.id): key,
+            }, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            return user, token
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        # The Token row itself is not needed by any view, so it is not loaded
+        return user, Token(key=key, user=user)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """Stateless signed-token authentication (see AUTH_STATELESS_TOKENS).
+
+    The token is verified from its signature alone, and the user comes from the
+    same cache as CachedTokenAuthentication, so a warm request touches neither
+    the token table nor api_user.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        cache = get_auth_cache()
+        user = cache.get(user_cache_key(user_id)) if user_id is not None else None
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(user_cache_key(user.id), user, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        elif not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_on_user_save(sender, instance, **kwargs):
+    # Covers profile edits, photo changes and password changes
+    invalidate_cached_user(instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_on_token_delete(sender, instance, **kwargs):
+    get_auth_cache().delete_many([token_cache_key(instance.key), user_token_cache_key(instance.user_id)])
+    # Wakes the user's event streams so they notice the token is gone
+    notify_user(instance.user_id)
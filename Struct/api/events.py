@@ -0,0 +1,62 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+# Seconds between keep-alive comments on an idle stream (keeps proxies from closing it)
+KEEPALIVE_SECONDS = 25
+
+
+class UserEventBroker:
+    """In-process fan-out of "this user's hearts/points changed" notifications.
+
+    Each open stream subscribes with its own asyncio queue. Views publish from
+    worker threads, so delivery hops onto the subscriber's event loop. Only
+    streams served by the same process are notified; a change made by another
+    worker is picked up at the stream's next scheduled wake-up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=1)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            self._subscribers[user_id].discard(subscriber)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_offer, queue)
+
+
+def _offer(queue):
+    # A pending notification already means "reload", so extra ones can be dropped
+    if not queue.full():
+        queue.put_nowait(True)
+
+
+broker = UserEventBroker()
+
+
+def notify_user(user_id):
+    """Tell the user's open event streams to refresh once the current transaction commits"""
+    transaction.on_commit(lambda: broker.publish(user_id))
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class HashPoolFull(Exception):
+    """Raised when too many password hashes are already waiting"""
+
+
+class PasswordHashPool:
+    """Bounded pool that runs password hashing off the request/event-loop thread.
+
+    PBKDF2 runs inside hashlib with the GIL released, so worker threads hash in
+    parallel while the ASGI event loop keeps serving other requests. Once
+    `max_workers + max_queue` hashes are in flight new ones are rejected, which
+    turns a login storm into fast 503s instead of an ever-growing backlog.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, func, *args):
+        """Run `func(*args)` on the pool and return its result"""
+        with self._lock:
+            if self.queued + self.running >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HashPoolFull("Too many sign-in requests, please retry shortly")
+            self.queued += 1
+        return await asyncio.wrap_future(self._executor.submit(self._call, func, *args))
+
+    def map(self, func, iterable):
+        """Run `func` over `iterable` from synchronous code, e.g. a bulk import in a web worker.
+
+        At most `max_workers` items are submitted at a time, so sign-ins keep
+        their queue slots while a large batch is hashed.
+        """
+        items = list(iterable)
+        results = []
+        for start in range(0, len(items), self.max_workers):
+            futures = []
+            for item in items[start:start + self.max_workers]:
+                with self._lock:
+                    self.queued += 1
+                futures.append(self._executor.submit(self._call, func, item))
+            results.extend(future.result() for future in futures)
+        return results
+
+    def _call(self, func, *args):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            # check_password() may re-save an upgraded hash, and worker threads never see
+            # request_finished, so expire their connection here instead
+            close_old_connections()
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queue_depth': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+
+hash_pool = PasswordHashPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_QUEUE)
@@ -0,0 +1,125 @@
+"""Shared cache of the serialized first page of each Galist leaderboard.
+
+Each board (all entries, best per player, and every day/week/class bucket
+set) caches its top GalistKeysetPagination.max_page_size rows once, already
+serialized, and any first-page request slices it, whatever its `limit`.
+A board's meta entry records the score a new entry must reach to enter that
+range. GalistLeaderboardSubmitView drops only the boards the new score actually
+enters, so most submissions leave the cache untouched.
+
+The backend is the LEADERBOARD_CACHE alias. The default local-memory cache is
+per process and relies on LEADERBOARD_CACHE_TIMEOUT to bound staleness in the
+other workers; a file-based or shared cache invalidates them all. The
+leaderboard's 304s are bounded the same way by VERSION_CACHE_TIMEOUT (see
+api.versions). Every key carries a generation, so clear_leaderboard_cache()
+drops all boards by replacing it and never touches other keys on a shared
+backend.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import GalistLeaderboard, GalistLeaderboardBucket, GALIST_RANK_ORDERING
+from .pagination import GalistKeysetPagination
+from .serializers import serialize_leaderboard_entries
+from .versions import bump_leaderboard_version
+
+CACHED_ROWS = GalistKeysetPagination.max_page_size
+
+BEST_BOARD = 'best'
+ENTRIES_BOARD = 'entries'
+
+GENERATION_KEY = 'galist-board-generation'
+
+
+def get_leaderboard_cache():
+    return caches[settings.LEADERBOARD_CACHE]
+
+
+def bucket_board(period, class_id=None):
+    # The period start is part of the name, so a new day or week starts a fresh board
+    return f'{period}:{GalistLeaderboardBucket.period_start_for(period).isoformat()}:{class_id or "all"}'
+
+
+def _generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _meta_key(generation, board):
+    return f'galist-board:{generation}:{board}'
+
+
+def get_first_page(board, queryset, request, page_size):
+    """Return (serialized rows, next cursor) of the first page of `board`, from the cache when possible"""
+    cache = get_leaderboard_cache()
+    # Photo URLs are absolute, so each host gets its own copy
+    host = request.build_absolute_uri('/')
+    meta_key = _meta_key(_generation(cache), board)
+    meta = cache.get(meta_key)
+    page = cache.get(f'{meta_key}:{meta["generation"]}:{host}') if meta else None
+
+    if page is None:
+        rows = list(queryset.order_by(*GALIST_RANK_ORDERING)[:CACHED_ROWS + 1])
+        has_more = len(rows) > CACHED_ROWS
+        rows = rows[:CACHED_ROWS]
+        entries = [row if isinstance(row, GalistLeaderboard) else row.entry for row in rows]
+        paginator = GalistKeysetPagination()
+        page = {
+            'data': serialize_leaderboard_entries(entries, request),
+            'cursors': [paginator.encode_cursor(row) for row in rows],
+            'has_more': has_more,
+        }
+
+        if meta is None:
+            meta = {
+                'generation': uuid.uuid4().hex,
+                # A board with free slots is entered by any score
+                'cutoff': (rows[-1].score, rows[-1].time_elapsed) if len(rows) == CACHED_ROWS else None,
+            }
+            if not cache.add(meta_key, meta, settings.LEADERBOARD_CACHE_TIMEOUT):
+                meta = cache.get(meta_key) or meta
+        cache.set(f'{meta_key}:{meta["generation"]}:{host}', page, settings.LEADERBOARD_CACHE_TIMEOUT)
+
+    has_next = len(page['data']) > page_size or (len(page['data']) == page_size and page['has_more'])
+    return page['data'][:page_size], page['cursors'][page_size - 1] if has_next else None
+
+
+def invalidate_for_entry(entry, is_personal_best, class_ids):
+    """Drop the cached boards that the new `entry` ranks into"""
+    # The same boards GalistLeaderboardBucket.record() writes to
+    boards = [ENTRIES_BOARD]
+    boards += [bucket_board(period) for period in (GalistLeaderboardBucket.PERIOD_DAY, GalistLeaderboardBucket.PERIOD_WEEK)]
+    boards += [bucket_board(period, class_id) for class_id in class_ids for period, _ in GalistLeaderboardBucket.PERIOD_CHOICES]
+    if is_personal_best:
+        boards.append(BEST_BOARD)
+
+    cache = get_leaderboard_cache()
+    generation = _generation(cache)
+    metas = cache.get_many([_meta_key(generation, board) for board in boards])
+    # Ties count as entering: the new row's id, the last tie-breaker, is not compared
+    stale = [
+        key for key, meta in metas.items()
+        if meta['cutoff'] is None or (entry.score, -entry.time_elapsed) >= (meta['cutoff'][0], -meta['cutoff'][1])
+    ]
+    cache.delete_many(stale)
+
+
+def invalidate_class_boards(class_id):
+    """Drop a class's cached boards after its membership changed"""
+    cache = get_leaderboard_cache()
+    generation = _generation(cache)
+    cache.delete_many([
+        _meta_key(generation, bucket_board(period, class_id)) for period, _ in GalistLeaderboardBucket.PERIOD_CHOICES
+    ])
+    bump_leaderboard_version()
+
+
+def clear_leaderboard_cache():
+    """Drop every cached board, e.g. after a player's name or photo changes"""
+    # Only orphans this module's keys, which then expire; cache.clear() would flush a shared backend
+    get_leaderboard_cache().set(GENERATION_KEY, uuid.uuid4().hex, None)
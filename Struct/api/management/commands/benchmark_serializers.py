@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+
+from api.models import GalistLeaderboard, User
+from api.serializers import (
+    GalistLeaderboardSerializer, UserHeartSerializer, UserProfileSerializer,
+    serialize_leaderboard_entries, serialize_user_hearts, serialize_user_profile,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare per-object cost of the DRF read serializers with their plain-dict fast paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=100,
+                            help="Objects serialized per call, like one leaderboard page (default: 100)")
+        parser.add_argument('--repeat', type=int, default=200, help="Calls timed per serializer (default: 200)")
+
+    def handle(self, *args, **options):
+        count, repeat = options['objects'], options['repeat']
+        request = RequestFactory().get('/api/galist/leaderboard/')
+        now = timezone.now()
+
+        # Unsaved instances: only serialization is measured, never the database
+        users = []
+        for i in range(count):
+            user = User(
+                id=i + 1, username=f'student{i}', email=f'student{i}@example.com', user_type='student',
+                points=i * 10, hearts=i % 10, hearts_gained_today=i % 3, last_heart_regen_time=now,
+            )
+            if i % 2:
+                user.profile_photo.name = f'profile_photos/sha256/{i:02x}/{i:064x}.jpg'
+                user.profile_photo_thumbnails = {'small': f'profile_photos/sha256/{i:02x}/{i:063x}s.webp'}
+            users.append(user)
+        entries = [
+            GalistLeaderboard(id=i + 1, user=user, score=1000 - i, time_elapsed=60 + i, created_at=now)
+            for i, user in enumerate(users)
+        ]
+
+        cases = [
+            ("UserProfileSerializer",
+             lambda: [UserProfileSerializer(user, context={'request': request}).data for user in users],
+             lambda: [serialize_user_profile(user, request) for user in users]),
+            ("UserHeartSerializer",
+             lambda: [UserHeartSerializer(user).data for user in users],
+             lambda: [serialize_user_hearts(user) for user in users]),
+            ("GalistLeaderboardSerializer",
+             lambda: GalistLeaderboardSerializer(entries, many=True, context={'request': request}).data,
+             lambda: serialize_leaderboard_entries(entries, request)),
+        ]
+
+        self.stdout.write(f"{count} objects x {repeat} calls, microseconds per object")
+        self.stdout.write(f"{'serializer':<30}{'DRF':>10}{'fast':>10}{'speedup':>10}")
+        for name, drf, fast in cases:
+            drf_cost, fast_cost = self.per_object(drf, count, repeat), self.per_object(fast, count, repeat)
+            self.stdout.write(f"{name:<30}{drf_cost:>10.2f}{fast_cost:>10.2f}{drf_cost / fast_cost:>9.1f}x")
+
+    def per_object(self, serialize, count, repeat):
+        serialize()  # Warm up lazy field construction and URL resolution
+        started = time.perf_counter()
+        for _ in range(repeat):
+            serialize()
+        return (time.perf_counter() - started) / (repeat * count) * 1e6
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.provisioning import provision_users, read_user_rows
+
+
+class Command(BaseCommand):
+    help = ("Create users in bulk from a CSV with username, email, password and optional "
+            "user_type and class_code columns. Re-running the same file resumes an interrupted import.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help="Path to the CSV file")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Users hashed and inserted per batch (default: 500)")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Password hashing processes (default: one per CPU)")
+        parser.add_argument('--class-code', default=None,
+                            help="Enroll every user into this class unless their row has a class_code")
+
+    def handle(self, *args, **options):
+        try:
+            csv_file = open(options['csv_path'], newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f"Cannot open {options['csv_path']}: {e}")
+
+        def report(summary):
+            self.stdout.write(
+                f"{summary['processed']} rows: {summary['created']} created, {summary['skipped']} already existed, "
+                f"{len(summary['errors'])} errors ({summary['elapsed']}s)"
+            )
+
+        with csv_file:
+            summary = provision_users(
+                read_user_rows(csv_file),
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                class_code=options['class_code'],
+                progress=report,
+            )
+
+        for error in summary['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {summary['created']} users and {summary['enrolled']} enrollments "
+            f"from {summary['processed']} rows in {summary['elapsed']}s"
+        ))
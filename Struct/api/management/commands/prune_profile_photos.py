@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import User
+from api.storage import CONTENT_ADDRESSED_PREFIX
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed profile photos and thumbnails that no user references any more"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Keep unreferenced files used more recently than this (default: 24)")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        storage = User._meta.get_field('profile_photo').storage
+        # Uploads still being saved have no row yet; the grace period keeps their files
+        cutoff = timezone.now() - timezone.timedelta(hours=options['grace_hours'])
+
+        referenced = set()
+        photos = User.objects.exclude(profile_photo='').exclude(profile_photo__isnull=True)
+        for photo, thumbnails in photos.values_list('profile_photo', 'profile_photo_thumbnails').iterator(chunk_size=2000):
+            referenced.add(photo)
+            referenced.update(thumbnails.values())
+
+        try:
+            shards, _ = storage.listdir(CONTENT_ADDRESSED_PREFIX)
+        except FileNotFoundError:
+            shards = []
+
+        deleted = kept = 0
+        for shard in shards:
+            _, files = storage.listdir(f'{CONTENT_ADDRESSED_PREFIX}{shard}')
+            for file_name in files:
+                name = f'{CONTENT_ADDRESSED_PREFIX}{shard}/{file_name}'
+                if name in referenced or storage.get_modified_time(name) > cutoff:
+                    kept += 1
+                    continue
+                if not options['dry_run']:
+                    storage.delete(name)
+                deleted += 1
+
+        action = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {deleted} unreferenced files and kept {kept} in {time.monotonic() - started:.2f}s"
+        ))
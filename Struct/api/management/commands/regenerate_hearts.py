@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from api.models import User, HEART_REGEN_MINUTES, last_daily_heart_reset
+
+
+class Command(BaseCommand):
+    help = "Apply the 8AM daily heart reset and catch-up heart regeneration to all users with set-based UPDATEs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of user ids covered by each UPDATE (default: 5000)")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        now = timezone.now()
+        regen_interval = timezone.timedelta(minutes=HEART_REGEN_MINUTES)
+
+        bounds = User.objects.aggregate(first_id=Min('id'), last_id=Max('id'))
+        if bounds['first_id'] is None:
+            self.stdout.write("No users to update")
+            return
+
+        users_reset = hearts_regenerated = 0
+        for batch_start in range(bounds['first_id'], bounds['last_id'] + 1, batch_size):
+            batch = User.objects.filter(id__gte=batch_start, id__lt=batch_start + batch_size)
+
+            with transaction.atomic():
+                # Same order as User.get_heart_state: reset the daily counter first...
+                users_reset += batch.filter(hearts_reset_date__lt=last_daily_heart_reset(now)).update(
+                    hearts_gained_today=0, hearts_reset_date=now
+                )
+
+                # ...then grant one heart per elapsed interval. Each pass adds at most one heart
+                # per user, so the loop runs at most max_daily_hearts times.
+                while True:
+                    updated = batch.filter(
+                        hearts__lt=F('max_hearts'),
+                        hearts_gained_today__lt=F('max_daily_hearts'),
+                        last_heart_regen_time__lte=now - regen_interval,
+                    ).update(
+                        hearts=F('hearts') + 1,
+                        hearts_gained_today=F('hearts_gained_today') + 1,
+                        last_heart_regen_time=F('last_heart_regen_time') + regen_interval,
+                    )
+                    if not updated:
+                        break
+                    hearts_regenerated += updated
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reset daily hearts for {users_reset} users and regenerated {hearts_regenerated} hearts "
+            f"in {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_galistleaderboard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='galistleaderboard',
+            index=models.Index(fields=['-score', 'time_elapsed', 'id'], name='galist_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_best_scores(apps, schema_editor):
+    GalistLeaderboard = apps.get_model('api', 'GalistLeaderboard')
+    GalistBestScore = apps.get_model('api', 'GalistBestScore')
+
+    best_by_user = {}
+    for entry in GalistLeaderboard.objects.order_by('-score', 'time_elapsed', 'id').iterator():
+        best_by_user.setdefault(entry.user_id, entry)
+
+    GalistBestScore.objects.bulk_create([
+        GalistBestScore(user_id=user_id, entry=entry, score=entry.score, time_elapsed=entry.time_elapsed)
+        for user_id, entry in best_by_user.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_galistleaderboard_rank_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalistBestScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(default=0)),
+                ('time_elapsed', models.IntegerField(help_text='Time in seconds')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.galistleaderboard')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='galist_best', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Galist Best Score',
+                'verbose_name_plural': 'Galist Best Scores',
+                'indexes': [models.Index(fields=['-score', 'time_elapsed', 'id'], name='galist_best_rank_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_best_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_galistbestscore'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='galistleaderboard',
+            index=models.Index(fields=['user', '-score', 'time_elapsed', 'id'], name='galist_user_rank_idx'),
+        ),
+    ]
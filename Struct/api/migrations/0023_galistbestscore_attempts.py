@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:53
+
+from django.db import migrations, models
+
+
+def backfill_attempt_stats(apps, schema_editor):
+    GalistLeaderboard = apps.get_model('api', 'GalistLeaderboard')
+    GalistBestScore = apps.get_model('api', 'GalistBestScore')
+
+    totals = GalistLeaderboard.objects.filter(user=models.OuterRef('user')).order_by() \
+        .values('user').annotate(attempts=models.Count('id'), total_score=models.Sum('score'))
+    GalistBestScore.objects.update(
+        attempts=models.Subquery(totals.values('attempts')),
+        total_score=models.Subquery(totals.values('total_score')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_galistleaderboard_user_rank_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='galistbestscore',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='galistbestscore',
+            name='total_score',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_attempt_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:54
+
+import api.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_galistbestscore_attempts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalistLeaderboardBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Daily'), ('week', 'Weekly'), ('all', 'All time')], max_length=4)),
+                ('period_start', models.DateField()),
+                ('score', models.IntegerField(default=0)),
+                ('time_elapsed', models.IntegerField(help_text='Time in seconds')),
+                ('class_obj', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='galist_buckets', to='api.class')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.galistleaderboard')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='galist_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Galist Leaderboard Bucket',
+                'verbose_name_plural': 'Galist Leaderboard Buckets',
+                'indexes': [models.Index(fields=['period', 'period_start', 'class_obj', '-score', 'time_elapsed', 'id'], name='galist_bucket_rank_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('class_obj__isnull', False)), fields=('period', 'period_start', 'class_obj', 'user'), name='galist_bucket_class_user_uniq'), models.UniqueConstraint(condition=models.Q(('class_obj__isnull', True)), fields=('period', 'period_start', 'user'), name='galist_bucket_user_uniq')],
+            },
+            bases=(api.models.GalistRankedMixin, models.Model),
+        ),
+    ]
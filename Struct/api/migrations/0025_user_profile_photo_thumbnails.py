@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_galistleaderboardbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_photo_thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:07
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_user_profile_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='profile_photo',
+            field=models.ImageField(blank=True, null=True, storage=api.storage.profile_photo_storage, upload_to='profile_photos/'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:34
+
+import datetime
+from collections import defaultdict
+
+from django.db import migrations
+from django.utils import timezone
+
+# Mirrors GalistLeaderboardBucket; historical models don't carry its methods
+RANK_ORDERING = ['-score', 'time_elapsed', 'id']
+RETENTION = {'day': datetime.timedelta(days=14), 'week': datetime.timedelta(weeks=12)}
+ALL_TIME_START = datetime.date(1970, 1, 1)
+
+
+def period_start_for(period, when):
+    day = timezone.localdate(when)
+    return day - datetime.timedelta(days=day.weekday()) if period == 'week' else day
+
+
+def backfill_buckets(apps, schema_editor):
+    """Build the buckets of entries and enrollments that predate 0024, as add_class_members does on join"""
+    GalistLeaderboard = apps.get_model('api', 'GalistLeaderboard')
+    GalistBestScore = apps.get_model('api', 'GalistBestScore')
+    GalistLeaderboardBucket = apps.get_model('api', 'GalistLeaderboardBucket')
+    Enrollment = apps.get_model('api', 'Class').students.through
+
+    class_ids = defaultdict(list)
+    for user_id, class_id in Enrollment.objects.values_list('user_id', 'class_id').iterator():
+        class_ids[user_id].append(class_id)
+
+    today = timezone.localdate()
+    oldest_start = {period: today - retention for period, retention in RETENTION.items()}
+    since = timezone.make_aware(datetime.datetime.combine(min(oldest_start.values()), datetime.time.min))
+
+    # Ranked order, so the first entry seen for a bucket is its best
+    best = {}
+    entries = GalistLeaderboard.objects.filter(created_at__gte=since).order_by(*RANK_ORDERING)
+    for entry in entries.only('id', 'user_id', 'score', 'time_elapsed', 'created_at').iterator(chunk_size=2000):
+        for period in RETENTION:
+            start = period_start_for(period, entry.created_at)
+            if start >= oldest_start[period]:
+                for class_id in (None, *class_ids.get(entry.user_id, ())):
+                    best.setdefault((period, start, class_id, entry.user_id), entry)
+    for best_score in GalistBestScore.objects.select_related('entry').iterator(chunk_size=2000):
+        for class_id in class_ids.get(best_score.user_id, ()):
+            best[('all', ALL_TIME_START, class_id, best_score.user_id)] = best_score.entry
+
+    # Buckets recorded since 0024 may hold a worse entry than the history does
+    existing = {
+        (bucket.period, bucket.period_start, bucket.class_obj_id, bucket.user_id): bucket
+        for bucket in GalistLeaderboardBucket.objects.iterator(chunk_size=2000)
+    }
+    to_create, to_update = [], []
+    for (period, start, class_id, user_id), entry in best.items():
+        bucket = existing.get((period, start, class_id, user_id))
+        if bucket is None:
+            to_create.append(GalistLeaderboardBucket(
+                period=period, period_start=start, class_obj_id=class_id, user_id=user_id,
+                entry_id=entry.id, score=entry.score, time_elapsed=entry.time_elapsed,
+            ))
+        elif (entry.score, -entry.time_elapsed, -entry.id) > (bucket.score, -bucket.time_elapsed, -bucket.entry_id):
+            bucket.entry_id, bucket.score, bucket.time_elapsed = entry.id, entry.score, entry.time_elapsed
+            to_update.append(bucket)
+
+    GalistLeaderboardBucket.objects.bulk_create(to_create, batch_size=1000)
+    GalistLeaderboardBucket.objects.bulk_update(to_update, ['entry', 'score', 'time_elapsed'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_user_profile_photo_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_buckets, migrations.RunPython.noop),
+    ]
@@ -3,10 +3,40 @@ from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.utils import timezone
+from django.db import connection, transaction
+from .storage import profile_photo_storage
 import random
 import string
 import datetime
 
+HEART_REGEN_MINUTES = 30  # Time in minutes to regenerate one heart
+DAILY_HEART_RESET_HOUR = 8  # hearts_gained_today resets at 8AM
+
+def last_daily_heart_reset(now):
+    """Return the most recent 8AM daily heart reset at or before `now`"""
+    todays_reset = timezone.make_aware(
+        datetime.datetime.combine(now.date(), datetime.time(hour=DAILY_HEART_RESET_HOUR, minute=0))
+    )
+    # If we're before 8AM, we should compare with yesterday's 8AM
+    if now.hour < DAILY_HEART_RESET_HOUR:
+        todays_reset = todays_reset - timezone.timedelta(days=1)
+    return todays_reset
+
+# Stored fields that together make up a user's heart state
+HEART_STATE_FIELDS = ('hearts', 'hearts_gained_today', 'hearts_reset_date', 'last_heart_regen_time')
+
+class HeartSpendConflict(Exception):
+    """Raised when spend_hearts() keeps losing races to concurrent heart updates"""
+
+# Longest edge in pixels of each generated profile photo thumbnail (see api.photos)
+PROFILE_THUMBNAIL_SIZES = {'small': 96, 'medium': 256}
+
+def profile_photo_name(photo_name, thumbnails, size='small'):
+    """Storage name to serve for a photo: its `size` thumbnail, or the original until thumbnails exist"""
+    if not photo_name:
+        return None
+    return thumbnails.get(size) or photo_name
+
 class User(AbstractUser):
     USER_TYPE_CHOICES = (
         ('student', 'Student'),
@@ -16,7 +46,8 @@ class User(AbstractUser):
 
     email = models.EmailField(_('email address'), unique=True)
     user_type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES, default='student')
-    profile_photo = models.ImageField(upload_to='profile_photos/', null=True, blank=True)
+    profile_photo = models.ImageField(upload_to='profile_photos/', storage=profile_photo_storage, null=True, blank=True)
+    profile_photo_thumbnails = models.JSONField(default=dict, blank=True)  # size -> storage name
     points = models.IntegerField(default=0)
     hearts = models.IntegerField(default=3)
     hints = models.IntegerField(default=3)
@@ -45,65 +76,110 @@ class User(AbstractUser):
         if self.profile_photo:
             return self.profile_photo.url
         return None
+
+    def get_profile_photo_thumbnail_url(self, size='small'):
+        name = profile_photo_name(self.profile_photo.name, self.profile_photo_thumbnails, size)
+        return self.profile_photo.storage.url(name) if name else None
         
-    def regenerate_hearts(self):
-        """Regenerate hearts based on time elapsed since last regeneration"""
-      
-        
-        # Check if we need to reset daily heart counter
-        self.reset_daily_hearts_if_needed()
-        
-        # If hearts are already at max, nothing to do
-        if self.hearts >= self.max_hearts:
-            return
-        
-        # Calculate time elapsed since last heart regeneration
-        now = timezone.now()
-        if not self.last_heart_regen_time:
-            self.last_heart_regen_time = now
-            self.save(update_fields=['last_heart_regen_time'])
-            return
-        
-        # Get time difference in minutes
-        time_diff = (now - self.last_heart_regen_time).total_seconds() / 60
-        heart_regen_minutes = 30  # Time in minutes to regenerate one heart
-        
-        # IMPORTANT: Add a safeguard to prevent instant regeneration when hearts_gained_today is manually reset
-        # If this appears to be the first regeneration after a counter reset (hearts_gained_today is 0 but hearts < max_hearts)
-        # and it hasn't been at least heart_regen_minutes since the last regeneration
-        if self.hearts_gained_today == 0 and self.hearts < self.max_hearts and time_diff < heart_regen_minutes:
-            # Don't allow instant regeneration - enforce waiting period
-            return
-        
-        # Calculate how many hearts to add based on time passed
-        hearts_to_add = int(time_diff / heart_regen_minutes)
-        
-        # If no hearts should be added based on time passed, return early
-        if hearts_to_add <= 0:
-            return
-            
-        # Check if we've reached daily limit
-        remaining_daily_hearts = self.max_daily_hearts - self.hearts_gained_today
-        hearts_to_add = min(hearts_to_add, remaining_daily_hearts)
-        
-        if hearts_to_add <= 0:
-            return  # Daily limit reached
-            
-        # Add hearts, but don't exceed max
-        new_hearts = min(self.hearts + hearts_to_add, self.max_hearts)
-        hearts_added = new_hearts - self.hearts
-        
-        if hearts_added > 0:
-            self.hearts = new_hearts
-            self.hearts_gained_today += hearts_added
-            
-            # Update the last regen time based on complete intervals only
-            self.last_heart_regen_time = self.last_heart_regen_time + timezone.timedelta(
-                minutes=hearts_added * heart_regen_minutes
+    def get_heart_state(self, now=None):
+        """Derive the current heart counters from the stored timestamps.
+
+        Nothing is written: hearts regenerate one per HEART_REGEN_MINUTES since
+        last_heart_regen_time, capped by max_hearts and by max_daily_hearts, whose
+        counter resets at 8AM each day. Returns the field values as a dict.
+        """
+        now = now or timezone.now()
+        hearts = self.hearts
+        hearts_gained_today = self.hearts_gained_today
+        hearts_reset_date = self.hearts_reset_date
+        last_heart_regen_time = self.last_heart_regen_time or now
+
+        # Reset the daily counter if the last reset was before today's 8AM.
+        # Hearts themselves still regenerate according to the timer.
+        if hearts_reset_date < last_daily_heart_reset(now):
+            hearts_gained_today = 0
+            hearts_reset_date = now
+
+        if hearts < self.max_hearts:
+            # Hearts earned by complete intervals, limited by the daily cap and max hearts
+            elapsed_intervals = int((now - last_heart_regen_time).total_seconds() // (HEART_REGEN_MINUTES * 60))
+            hearts_added = max(0, min(
+                elapsed_intervals,
+                self.max_daily_hearts - hearts_gained_today,
+                self.max_hearts - hearts,
+            ))
+            if hearts_added:
+                hearts += hearts_added
+                hearts_gained_today += hearts_added
+                # Advance by complete intervals only so partial progress is kept
+                last_heart_regen_time += timezone.timedelta(minutes=hearts_added * HEART_REGEN_MINUTES)
+
+        return {
+            'hearts': hearts,
+            'hearts_gained_today': hearts_gained_today,
+            'hearts_reset_date': hearts_reset_date,
+            'last_heart_regen_time': last_heart_regen_time,
+        }
+
+    def regenerate_hearts(self, now=None):
+        """Bring the in-memory heart fields up to date without saving.
+
+        Returns the names of the fields that changed, for callers that persist them.
+        """
+        changed_fields = []
+        for field, value in self.get_heart_state(now).items():
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed_fields.append(field)
+        return changed_fields
+
+    def spend_hearts(self, hearts_to_use, now=None, max_retries=5):
+        """Atomically regenerate and spend hearts with a single conditional UPDATE.
+
+        The UPDATE only applies if the stored heart fields still match the ones the
+        new state was derived from, so concurrent spends can never double-spend.
+        On a lost race the fields are re-read and the spend retried. Returns True
+        if the hearts were spent and False if there are not enough; raises
+        HeartSpendConflict once `max_retries` races are lost. The instance holds
+        the latest state either way.
+        """
+        now = now or timezone.now()
+        for _ in range(max_retries):
+            stored = {field: getattr(self, field) for field in HEART_STATE_FIELDS}
+            state = self.get_heart_state(now)
+
+            if state['hearts'] < hearts_to_use:
+                self.regenerate_hearts(now)
+                return False
+
+            # While hearts are full the regen timer is idle, so it starts from the moment one is spent
+            if state['hearts'] >= self.max_hearts:
+                state['last_heart_regen_time'] = now
+            state['hearts'] -= hearts_to_use
+
+            if User.objects.filter(pk=self.pk, **stored).update(**state):
+                for field, value in state.items():
+                    setattr(self, field, value)
+                return True
+
+            self.refresh_from_db(fields=HEART_STATE_FIELDS)
+        raise HeartSpendConflict("Hearts were changed by another request, please retry")
+
+    def add_quiz_points(self, points_to_add):
+        """Add quiz points and count the attempt in one UPDATE ... RETURNING.
+
+        Returns the new (points, quiz_attempts) totals and updates the instance.
+        """
+        table = connection.ops.quote_name(self._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET points = points + %s, quiz_attempts = quiz_attempts + 1 "
+                f"WHERE id = %s RETURNING points, quiz_attempts",
+                [points_to_add, self.pk]
             )
-            
-            self.save(update_fields=['hearts', 'last_heart_regen_time', 'hearts_gained_today'])
-            
+            self.points, self.quiz_attempts = cursor.fetchone()
+        return self.points, self.quiz_attempts
+
     def get_next_heart_time(self):
         """Calculate time until next heart regeneration"""
         # No regeneration if at max hearts or daily limit reached
@@ -111,88 +187,12 @@ class User(AbstractUser):
             return None
             
         # Calculate when the next heart will be available
-        next_heart_time = self.last_heart_regen_time + timezone.timedelta(minutes=30)
-        #next_heart_time = self.last_heart_regen_time + timezone.timedelta(minutes=1)
+        next_heart_time = self.last_heart_regen_time + timezone.timedelta(minutes=HEART_REGEN_MINUTES)
         time_remaining = next_heart_time - timezone.now()
         
         # Return milliseconds for easy frontend use
         return max(0, time_remaining.total_seconds() * 1000) if time_remaining.total_seconds() > 0 else 0
 
-    def reset_daily_hearts_if_needed(self):
-        """Reset hearts_gained_today at 8AM each day"""
-        now = timezone.now()
-        today = now.date()
-        
-        # Create today's reset time (8AM today)
-        todays_reset = timezone.make_aware(
-            datetime.datetime.combine(today, datetime.time(hour=8, minute=0))
-        )
-        
-        # If we're before 8AM, we should compare with yesterday's 8AM
-        if now.hour < 8:
-            todays_reset = todays_reset - timezone.timedelta(days=1)
-        
-        # If the last reset was before today's reset time (8AM)
-        if self.hearts_reset_date < todays_reset:
-            # Only reset the counter, don't give hearts immediately
-            self.hearts_gained_today = 0
-            self.hearts_reset_date = now
-            
-            # Don't update hearts or last_heart_regen_time here
-            # This ensures that when hearts_gained_today is reset, 
-            # hearts still regenerate according to the timer
-            self.save(update_fields=['hearts_gained_today', 'hearts_reset_date'])
-
-def post(self, request):
-        try:
-            points_to_add = request.data.get('score', 0)
-            quiz_type = request.data.get('quiz_type', 'unknown')
-            
-            if not isinstance(points_to_add, (int, float)) or points_to_add < 0:
-                return Response({
-                    'success': False,
-                    'error': 'Invalid score value'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            user = request.user
-            
-            with transaction.atomic():
-                user.points = F('points') + points_to_add
-                user.quiz_attempts = F('quiz_attempts') + 1
-                user.save(update_fields=['points', 'quiz_attempts'])
-                user.refresh_from_db()
-            
-            return Response({
-                'success': True,
-                'points_added': points_to_add,
-                'total_points': user.points,
-                'attempts': user.quiz_attempts,
-                'quiz_type': quiz_type
-            }, status=status.HTTP_200_OK)
-            
-        except Exception as e:
-            return Response({
-                'success': False,
-                'error': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-def get(self, request):
-        user = request.user
-        # Force refresh from database to get latest values
-        user.refresh_from_db()
-        
-        return Response({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'user_type': user.user_type,
-            'points': user.points,
-            'hearts': user.hearts,
-            'hints': user.hints,
-            'quiz_attempts': getattr(user, 'quiz_attempts', 0),
-            'profile_photo_url': user.profile_photo.url if user.profile_photo else None,
-        })
-
 def generate_class_code():
     """Generate a random 6-character alphanumeric class code"""
     characters = string.ascii_uppercase + string.digits
@@ -209,17 +209,74 @@ class Class(models.Model):
     def __str__(self):
         return f"{self.name} ({self.code})"
 
-class GalistLeaderboard(models.Model):
+# Leaderboard ranking order: highest score first, then fastest time, then oldest entry.
+# The trailing id makes the order total so rank and neighbour lookups are stable.
+GALIST_RANK_ORDERING = ['-score', 'time_elapsed', 'id']
+
+class GalistLeaderboardQuerySet(models.QuerySet):
+    def ranked(self):
+        """Entries in leaderboard order (served straight from galist_rank_idx)"""
+        return self.order_by(*GALIST_RANK_ORDERING)
+
+    def ahead_of(self, score, time_elapsed, pk):
+        """Entries ranked strictly above the given (score, time_elapsed, id) position"""
+        return self.filter(
+            models.Q(score__gt=score)
+            | models.Q(score=score, time_elapsed__lt=time_elapsed)
+            | models.Q(score=score, time_elapsed=time_elapsed, id__lt=pk)
+        )
+
+    def behind(self, score, time_elapsed, pk):
+        """Entries ranked strictly below the given (score, time_elapsed, id) position"""
+        return self.filter(
+            models.Q(score__lt=score)
+            | models.Q(score=score, time_elapsed__gt=time_elapsed)
+            | models.Q(score=score, time_elapsed=time_elapsed, id__gt=pk)
+        )
+
+class GalistRankedMixin:
+    """Rank lookups shared by models ordered by GALIST_RANK_ORDERING"""
+
+    def get_board_queryset(self):
+        """Rows sharing this row's leaderboard"""
+        return type(self).objects.all()
+
+    def get_rank(self):
+        """Return this row's 1-based position on its leaderboard.
+
+        This counts the rows ahead of it over the rank index, so the cost grows
+        with the rank (O(n) at the bottom of a board), not O(log n).
+        """
+        return self.get_board_queryset().ahead_of(self.score, self.time_elapsed, self.pk).count() + 1
+
+    def get_neighbours(self, radius=2, queryset=None):
+        """Return up to `radius` rows directly above and below this one, in leaderboard order"""
+        if queryset is None:
+            queryset = self.get_board_queryset()
+        above = queryset.ahead_of(self.score, self.time_elapsed, self.pk) \
+            .order_by('score', '-time_elapsed', '-id')[:radius]
+        below = queryset.behind(self.score, self.time_elapsed, self.pk).ranked()[:radius]
+        return list(reversed(above)), list(below)
+
+class GalistLeaderboard(GalistRankedMixin, models.Model):
     """Model to store Galist game leaderboard entries"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='galist_scores')
     score = models.IntegerField(default=0)
     time_elapsed = models.IntegerField(help_text="Time in seconds")  # Store time in seconds
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = GalistLeaderboardQuerySet.as_manager()
     
     class Meta:
         ordering = ['-score', 'time_elapsed']  # Order by highest score, then fastest time
         verbose_name = 'Galist Leaderboard Entry'
         verbose_name_plural = 'Galist Leaderboard Entries'
+        indexes = [
+            # Matches GALIST_RANK_ORDERING so top-N, rank and neighbour queries are index range scans
+            models.Index(fields=GALIST_RANK_ORDERING, name='galist_rank_idx'),
+            # Same order scoped to one player, for paging through a user's own history
+            models.Index(fields=['user', *GALIST_RANK_ORDERING], name='galist_user_rank_idx'),
+        ]
     
     def __str__(self):
         minutes = self.time_elapsed // 60
@@ -230,4 +287,206 @@ class GalistLeaderboard(models.Model):
         """Return time in MM:SS format"""
         minutes = self.time_elapsed // 60
         seconds = self.time_elapsed % 60
-        return f"{minutes}:{seconds:02d}"
\ No newline at end of file
+        return f"{minutes}:{seconds:02d}"
+
+class GalistBestScore(GalistRankedMixin, models.Model):
+    """Materialized best Galist leaderboard entry and attempt stats per user"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='galist_best')
+    entry = models.ForeignKey(GalistLeaderboard, on_delete=models.CASCADE, related_name='+')
+    # Copied from entry so the per-user leaderboard can be ranked from its own index
+    score = models.IntegerField(default=0)
+    time_elapsed = models.IntegerField(help_text="Time in seconds")
+    # Running totals so the user's score summary never has to aggregate their history
+    attempts = models.IntegerField(default=0)
+    total_score = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = GalistLeaderboardQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Galist Best Score'
+        verbose_name_plural = 'Galist Best Scores'
+        indexes = [
+            models.Index(fields=GALIST_RANK_ORDERING, name='galist_best_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - best {self.score} points"
+
+    @property
+    def average_score(self):
+        return round(self.total_score / self.attempts, 2) if self.attempts else 0
+
+    @classmethod
+    def record(cls, entry):
+        """Count `entry` as an attempt and store it as the user's best if it beats the old one.
+
+        Returns True when `entry` became the user's personal best.
+        """
+        with transaction.atomic():
+            # Row lock keeps attempts/total_score exact when the same user submits concurrently
+            best, created = cls.objects.select_for_update().get_or_create(
+                user_id=entry.user_id,
+                defaults={
+                    'entry': entry, 'score': entry.score, 'time_elapsed': entry.time_elapsed,
+                    'attempts': 1, 'total_score': entry.score,
+                }
+            )
+            if created:
+                return True
+
+            is_personal_best = (entry.score, -entry.time_elapsed) > (best.score, -best.time_elapsed)
+            best.attempts += 1
+            best.total_score += entry.score
+            update_fields = ['attempts', 'total_score', 'updated_at']
+            if is_personal_best:
+                best.entry = entry
+                best.score = entry.score
+                best.time_elapsed = entry.time_elapsed
+                update_fields += ['entry', 'score', 'time_elapsed']
+
+            best.save(update_fields=update_fields)
+            return is_personal_best
+
+class GalistLeaderboardBucket(GalistRankedMixin, models.Model):
+    """Best Galist entry per user inside one leaderboard window.
+
+    Buckets are keyed by period (day/week/all-time) and optionally by class, and are
+    updated on every submit so windowed and class leaderboards never have to filter
+    or sort the raw entry table. Expired day/week buckets are compacted away.
+    """
+    PERIOD_DAY = 'day'
+    PERIOD_WEEK = 'week'
+    PERIOD_ALL = 'all'
+    PERIOD_CHOICES = (
+        (PERIOD_DAY, 'Daily'),
+        (PERIOD_WEEK, 'Weekly'),
+        (PERIOD_ALL, 'All time'),
+    )
+    # How long finished buckets are kept before compaction
+    RETENTION = {
+        PERIOD_DAY: datetime.timedelta(days=14),
+        PERIOD_WEEK: datetime.timedelta(weeks=12),
+    }
+    ALL_TIME_START = datetime.date(1970, 1, 1)
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    class_obj = models.ForeignKey('Class', on_delete=models.CASCADE, null=True, blank=True, related_name='galist_buckets')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='galist_buckets')
+    entry = models.ForeignKey(GalistLeaderboard, on_delete=models.CASCADE, related_name='+')
+    score = models.IntegerField(default=0)
+    time_elapsed = models.IntegerField(help_text="Time in seconds")
+
+    objects = GalistLeaderboardQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Galist Leaderboard Bucket'
+        verbose_name_plural = 'Galist Leaderboard Buckets'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'class_obj', 'user'],
+                condition=models.Q(class_obj__isnull=False), name='galist_bucket_class_user_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'user'],
+                condition=models.Q(class_obj__isnull=True), name='galist_bucket_user_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start', 'class_obj', *GALIST_RANK_ORDERING], name='galist_bucket_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.period} {self.period_start} - {self.score} points"
+
+    def get_board_queryset(self):
+        # One board per window and class, not the whole table
+        return type(self).objects.filter(
+            period=self.period, period_start=self.period_start, class_obj_id=self.class_obj_id
+        )
+
+    @classmethod
+    def period_start_for(cls, period, when=None):
+        """Return the first day of the `period` window containing `when`"""
+        if period == cls.PERIOD_ALL:
+            return cls.ALL_TIME_START
+        day = timezone.localdate(when)
+        if period == cls.PERIOD_WEEK:
+            return day - datetime.timedelta(days=day.weekday())
+        return day
+
+    @classmethod
+    def record(cls, entry, class_ids=()):
+        """Roll `entry` into the global day/week buckets and the day/week/all buckets of `class_ids`"""
+        keys = [(period, None) for period in (cls.PERIOD_DAY, cls.PERIOD_WEEK)]
+        keys += [(period, class_id) for class_id in class_ids for period, _ in cls.PERIOD_CHOICES]
+        starts = {period: cls.period_start_for(period, entry.created_at) for period, _ in cls.PERIOD_CHOICES}
+
+        with transaction.atomic():
+            # Open the missing buckets with this entry; buckets that already exist are left alone
+            cls.objects.bulk_create([
+                cls(period=period, period_start=starts[period], class_obj_id=class_id, user_id=entry.user_id,
+                    entry=entry, score=entry.score, time_elapsed=entry.time_elapsed)
+                for period, class_id in keys
+            ], ignore_conflicts=True)
+
+            # Lock them all, including any a concurrent submit opened first, and keep the better entry
+            opened = False
+            for bucket in cls.objects.select_for_update().filter(
+                user_id=entry.user_id,
+                period_start__in=set(starts.values()),
+            ).filter(
+                models.Q(class_obj__isnull=True) | models.Q(class_obj_id__in=list(class_ids))
+            ):
+                if (bucket.period, bucket.class_obj_id) not in keys or bucket.period_start != starts[bucket.period]:
+                    continue
+                if bucket.entry_id == entry.id:
+                    opened = True
+                elif (entry.score, -entry.time_elapsed) > (bucket.score, -bucket.time_elapsed):
+                    bucket.entry = entry
+                    bucket.score = entry.score
+                    bucket.time_elapsed = entry.time_elapsed
+                    bucket.save(update_fields=['entry', 'score', 'time_elapsed'])
+
+        if opened:
+            # A new bucket was opened, which is the only time old ones can have expired
+            cls.compact()
+
+    @classmethod
+    def add_class_members(cls, class_id, user_ids):
+        """Backfill the class buckets of students who just joined from their existing entries"""
+        today = timezone.localdate()
+        oldest_start = {period: today - retention for period, retention in cls.RETENTION.items()}
+        since = timezone.make_aware(datetime.datetime.combine(min(oldest_start.values()), datetime.time.min))
+
+        best = {}
+        # Ranked order, so the first entry seen for a bucket is its best
+        entries = GalistLeaderboard.objects.filter(user_id__in=user_ids, created_at__gte=since).ranked()
+        for entry in entries.only('id', 'user_id', 'score', 'time_elapsed', 'created_at').iterator():
+            for period in cls.RETENTION:
+                start = cls.period_start_for(period, entry.created_at)
+                if start >= oldest_start[period]:
+                    best.setdefault((period, start, entry.user_id), entry)
+        for best_score in GalistBestScore.objects.filter(user_id__in=user_ids).select_related('entry'):
+            best[(cls.PERIOD_ALL, cls.ALL_TIME_START, best_score.user_id)] = best_score.entry
+
+        cls.objects.bulk_create([
+            cls(period=period, period_start=start, class_obj_id=class_id, user_id=user_id,
+                entry=entry, score=entry.score, time_elapsed=entry.time_elapsed)
+            for (period, start, user_id), entry in best.items()
+        ], ignore_conflicts=True)
+
+    @classmethod
+    def remove_class_members(cls, class_id, user_ids):
+        """Take students who left or were removed off the class boards"""
+        return cls.objects.filter(class_obj_id=class_id, user_id__in=user_ids).delete()[0]
+
+    @classmethod
+    def compact(cls, today=None):
+        """Delete day/week buckets older than their retention window"""
+        today = today or timezone.localdate()
+        deleted = 0
+        for period, retention in cls.RETENTION.items():
+            deleted += cls.objects.filter(period=period, period_start__lt=today - retention).delete()[0]
+        return deleted
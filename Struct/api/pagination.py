@@ -0,0 +1,53 @@
+import base64
+import binascii
+
+from .models import GALIST_RANK_ORDERING
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+class GalistKeysetPagination:
+    """Keyset pagination over GALIST_RANK_ORDERING.
+
+    The cursor is the (score, time_elapsed, id) of the last row on the previous
+    page, so every page is a single range scan on the rank index no matter how
+    deep the client pages.
+    """
+    default_page_size = 10
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.default_page_size))
+        except ValueError:
+            return self.default_page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, row):
+        raw = f"{row.score}:{row.time_elapsed}:{row.pk}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            score, time_elapsed, pk = (int(part) for part in raw.split(':'))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise InvalidCursor("Invalid cursor")
+        return score, time_elapsed, pk
+
+    def paginate_queryset(self, queryset, request):
+        """Return (rows, next_cursor) for the page requested by `request`"""
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+
+        if cursor:
+            queryset = queryset.behind(*self.decode_cursor(cursor))
+
+        # Fetch one extra row to find out whether there is a next page
+        rows = list(queryset.order_by(*GALIST_RANK_ORDERING)[:page_size + 1])
+        next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size], next_cursor
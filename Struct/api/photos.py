@@ -0,0 +1,107 @@
+"""Profile photo uploads and background thumbnail generation.
+
+save_profile_photo() streams the upload to storage and updates only the
+photo columns, so the request returns as soon as the original is stored.
+Thumbnails for every PROFILE_THUMBNAIL_SIZES entry are then rendered with
+Pillow on a small thread pool. Until they are ready, URLs fall back to the
+original.
+
+Photos live in content-addressed storage (see api.storage), so re-uploading
+an image someone already has reuses both the file and its thumbnails.
+Replaced photos may still be shared, so they are left for the
+prune_profile_photos command instead of being deleted here.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .authentication import invalidate_cached_user
+from .events import notify_user
+from .leaderboard_cache import clear_leaderboard_cache
+from .models import PROFILE_THUMBNAIL_SIZES, User
+from .versions import bump_leaderboard_version
+
+logger = logging.getLogger(__name__)
+
+# WebP is much smaller at the same quality; JPEG covers Pillow builds without it
+THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+_executor = ThreadPoolExecutor(max_workers=settings.PHOTO_THUMBNAIL_WORKERS, thread_name_prefix='photo-thumbnails')
+
+
+class InvalidPhoto(ValueError):
+    pass
+
+
+def save_profile_photo(user, upload):
+    """Store `upload` as the user's photo and queue its thumbnails; returns the stored name"""
+    try:
+        # Only reads the header, so even a large upload is checked cheaply
+        with Image.open(upload) as image:
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise InvalidPhoto("Upload a valid image file") from e
+    upload.seek(0)
+
+    field = user.profile_photo.field
+    # Saved chunk by chunk (or moved, for uploads already spooled to a temporary file)
+    name = field.storage.save(field.generate_filename(user, upload.name), upload, max_length=field.max_length)
+
+    # A duplicate of a photo someone already has can take their thumbnails as well
+    thumbnails = (
+        User.objects.filter(profile_photo=name).exclude(profile_photo_thumbnails={})
+        .values_list('profile_photo_thumbnails', flat=True).first()
+    ) or {}
+
+    User.objects.filter(pk=user.pk).update(profile_photo=name, profile_photo_thumbnails=thumbnails)
+    user.profile_photo.name = name
+    user.profile_photo_thumbnails = thumbnails
+    invalidate_cached_user(user.pk)
+    bump_leaderboard_version()
+    transaction.on_commit(clear_leaderboard_cache)
+
+    if not thumbnails:
+        transaction.on_commit(lambda: _executor.submit(_generate_thumbnails, user.pk, name))
+    return name
+
+
+def _generate_thumbnails(user_id, name):
+    try:
+        thumbnails = generate_thumbnails(name)
+    except Exception:
+        logger.exception("Generating thumbnails for %s failed; serving the original", name)
+        return
+
+    try:
+        # Skip if another upload replaced this photo in the meantime
+        if User.objects.filter(pk=user_id, profile_photo=name).update(profile_photo_thumbnails=thumbnails):
+            invalidate_cached_user(user_id)
+            bump_leaderboard_version()
+            clear_leaderboard_cache()
+            notify_user(user_id)
+    finally:
+        # Worker threads never see request_finished, so expire their connection here instead
+        close_old_connections()
+
+
+def generate_thumbnails(name):
+    """Render every thumbnail size of stored image `name`; returns {size: storage name}"""
+    storage = User._meta.get_field('profile_photo').storage
+    with storage.open(name) as source, Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA') or THUMBNAIL_FORMAT == 'JPEG':
+            image = image.convert('RGBA' if THUMBNAIL_FORMAT == 'WEBP' else 'RGB')
+
+        thumbnails = {}
+        for size, pixels in PROFILE_THUMBNAIL_SIZES.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail((pixels, pixels), Image.LANCZOS)
+            buffer = BytesIO()
+            thumbnail.save(buffer, THUMBNAIL_FORMAT, quality=80)
+            thumbnails[size] = storage.save(f'thumbnail.{THUMBNAIL_EXTENSION}', ContentFile(buffer.getvalue()))
+        return thumbnails
@@ -0,0 +1,220 @@
+"""Optional write-behind buffer for quiz points.
+
+With POINTS_WRITE_BEHIND enabled, PointsUpdateView records each submission as
+a per-user (points, attempts) delta instead of updating api_user directly.
+A background thread flushes the summed deltas every POINTS_FLUSH_INTERVAL
+seconds with one batched UPDATE per chunk of users. A class-wide quiz then
+becomes a handful of statements instead of one row UPDATE per student.
+
+Durability: every delta is appended to a per-process journal file in
+POINTS_JOURNAL_DIR (fsynced when POINTS_JOURNAL_FSYNC is on) before the
+request is acknowledged. Journals are deleted only after their deltas
+commit. Live processes hold an flock on their journals, so any unlocked
+journal belongs to a dead process and is replayed by the next buffer to
+start. A crash between a flush committing and its journal being deleted
+can replay that journal once more.
+
+Read-your-writes: read_through() reloads the user's totals and adds the
+deltas still buffered in this process, so UserProfileView never shows
+points lower than what the user was just told.
+"""
+import atexit
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+
+from .authentication import invalidate_cached_user
+from .events import broker
+from .models import User
+from .versions import bump_user_version
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = '.log'
+FLUSH_BATCH_SIZE = 500
+
+
+def apply_point_deltas(deltas):
+    """Add {user_id: (points, attempts)} to api_user in batched UPDATEs"""
+    items = sorted(deltas.items())  # Fixed lock order so concurrent flushes cannot deadlock
+    with transaction.atomic():
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            chunk = items[start:start + FLUSH_BATCH_SIZE]
+            User.objects.filter(id__in=[user_id for user_id, _ in chunk]).update(
+                points=F('points') + Case(
+                    *[When(id=user_id, then=Value(points)) for user_id, (points, _) in chunk], default=Value(0)
+                ),
+                quiz_attempts=F('quiz_attempts') + Case(
+                    *[When(id=user_id, then=Value(attempts)) for user_id, (_, attempts) in chunk], default=Value(0)
+                ),
+            )
+
+
+def merge_deltas(into, deltas):
+    for user_id, (points, attempts) in deltas.items():
+        old_points, old_attempts = into.get(user_id, (0, 0))
+        into[user_id] = (old_points + points, old_attempts + attempts)
+
+
+class PointsWriteBehindBuffer:
+    def __init__(self, journal_dir, flush_interval, fsync=True):
+        self.journal_dir = Path(journal_dir)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._lock = threading.Lock()  # Guards _pending and the active journal
+        self._flush_lock = threading.Lock()  # Held while deltas are in flight to the database
+        self._pending = {}
+        self._journal = None  # (path, file) of the journal new deltas are appended to
+        self._sealed = []  # Rotated journals whose deltas have not been committed yet
+        self._stop = threading.Event()
+
+    def start(self):
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self._journal = self._open_journal()
+        self.recover()
+        threading.Thread(target=self._run, name='points-write-behind', daemon=True).start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def add(self, user_id, points, attempts=1):
+        """Durably record a delta; it reaches the database on the next flush"""
+        with self._lock:
+            _, journal = self._journal
+            journal.write(f"{user_id} {points} {attempts}\n")
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+            merge_deltas(self._pending, {user_id: (points, attempts)})
+        # read_through() now reports different totals
+        bump_user_version(user_id)
+
+    def pending_for(self, user_id):
+        with self._lock:
+            return self._pending.get(user_id, (0, 0))
+
+    def read_through(self, user):
+        """Reload the user's points and attempts with this process's unflushed deltas applied"""
+        # Holding the flush lock means no delta can be both committed and still counted as pending
+        with self._flush_lock:
+            user.refresh_from_db(fields=['points', 'quiz_attempts'])
+            points, attempts = self.pending_for(user.id)
+        user.points += points
+        user.quiz_attempts += attempts
+        return user.points, user.quiz_attempts
+
+    def flush(self):
+        """Write all buffered deltas to the database; returns the number of users updated"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, {}
+                self._sealed.append(self._journal)
+                self._journal = self._open_journal()
+                sealed, self._sealed = self._sealed, []
+
+            try:
+                apply_point_deltas(pending)
+            except Exception:
+                # Keep the deltas and their journals for the next attempt
+                with self._lock:
+                    merge_deltas(self._pending, pending)
+                    self._sealed = sealed + self._sealed
+                raise
+
+            for path, journal in sealed:
+                os.unlink(path)
+                journal.close()
+
+        for user_id in pending:
+            invalidate_cached_user(user_id)
+            broker.publish(user_id)
+        return len(pending)
+
+    def recover(self):
+        """Replay journals left behind by processes that died before flushing"""
+        for path in sorted(self.journal_dir.glob(f'*{JOURNAL_SUFFIX}')):
+            try:
+                journal = open(path, 'r')
+            except FileNotFoundError:
+                continue  # Already recovered by another process
+            with journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Owned by a live process
+                try:
+                    if os.stat(path).st_ino != os.fstat(journal.fileno()).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue  # Recovered and removed while we waited for the lock
+
+                deltas = {}
+                for line in journal:
+                    try:
+                        user_id, points, attempts = (int(part) for part in line.split())
+                    except ValueError:
+                        continue  # Torn final line from a crash mid-write; it was never acknowledged
+                    merge_deltas(deltas, {user_id: (points, attempts)})
+
+                if deltas:
+                    apply_point_deltas(deltas)
+                    logger.info("Recovered points for %d users from %s", len(deltas), path.name)
+                os.unlink(path)
+
+    def _open_journal(self):
+        # Lock under a temporary name first so recover() can never claim a journal we are about to use
+        name = f'points-{os.getpid()}-{uuid.uuid4().hex}'
+        path = self.journal_dir / f'{name}{JOURNAL_SUFFIX}'
+        temp_path = self.journal_dir / f'{name}.tmp'
+        journal = open(temp_path, 'a')
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        os.rename(temp_path, path)
+        return path, journal
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            # This thread never sees request_started/finished, so a dropped or expired
+            # connection is only replaced here
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered points failed; retrying next interval")
+            finally:
+                close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_points_buffer():
+    """Return this process's write-behind buffer, or None when the mode is off"""
+    global _buffer
+    if not settings.POINTS_WRITE_BEHIND:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            if fcntl is None:
+                raise ImproperlyConfigured("POINTS_WRITE_BEHIND needs POSIX file locking (fcntl)")
+            _buffer = PointsWriteBehindBuffer(
+                settings.POINTS_JOURNAL_DIR, settings.POINTS_FLUSH_INTERVAL, settings.POINTS_JOURNAL_FSYNC
+            )
+            _buffer.start()
+        return _buffer
@@ -0,0 +1,195 @@
+"""Bulk user provisioning from CSV (used by the provision_users command and admin endpoint).
+
+CSV columns: username, email, password, and optionally user_type and class_code.
+Rows are processed in batches: passwords are hashed in parallel on a process
+pool (or, inside a web worker, on the password hash thread pool), the batch is
+inserted with one bulk_create, and students are enrolled into their class with
+one more. Rows whose email already exists are skipped (but still enrolled), so
+re-running the same file resumes an interrupted import.
+
+Enrollment follows the same rules as the class views: only students are
+enrolled, each into at most one class, and their class leaderboard buckets are
+backfilled.
+"""
+import csv
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .leaderboard_cache import invalidate_class_boards
+from .models import Class, GalistLeaderboardBucket, User
+
+USER_TYPES = {choice for choice, _ in User.USER_TYPE_CHOICES}
+
+
+def _init_hash_worker():
+    # Spawned (non-fork) workers need Django configured before make_password can run
+    import django
+    django.setup()
+
+
+def read_user_rows(lines):
+    """Yield one dict per CSV row from an iterable of text lines"""
+    for row in csv.DictReader(lines):
+        yield {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+def iter_provision_users(rows, batch_size=500, workers=None, class_code=None, hash_pool=None):
+    """Create users from `rows`, yielding the running summary dict after each batch.
+
+    `class_code` enrolls every row into that class unless the row names its own.
+    Passwords are hashed on a new pool of `workers` processes, or on `hash_pool`
+    (an api.hashing.PasswordHashPool) if given. Web workers must pass one:
+    forking a process that is serving requests is not safe.
+    """
+    summary = {'processed': 0, 'created': 0, 'skipped': 0, 'enrolled': 0, 'errors': [], 'elapsed': 0}
+    started = time.monotonic()
+    rows = iter(rows)
+
+    with ExitStack() as stack:
+        if hash_pool is None:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers, initializer=_init_hash_worker))
+            hash_passwords = partial(pool.map, make_password, chunksize=16)
+        else:
+            hash_passwords = partial(hash_pool.map, make_password)
+
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            _provision_batch(batch, hash_passwords, class_code, summary)
+            summary['elapsed'] = round(time.monotonic() - started, 2)
+            yield summary
+
+
+def provision_users(rows, batch_size=500, workers=None, class_code=None, progress=None, hash_pool=None):
+    """Create users from `rows` and return the final summary.
+
+    `progress`, if given, is called with the running summary after each batch.
+    """
+    summary = {'processed': 0, 'created': 0, 'skipped': 0, 'enrolled': 0, 'errors': [], 'elapsed': 0}
+    for summary in iter_provision_users(rows, batch_size, workers, class_code, hash_pool):
+        if progress:
+            progress(summary)
+    return summary
+
+
+def _provision_batch(batch, hash_passwords, default_class_code, summary):
+    first_row = summary['processed'] + 1
+    summary['processed'] += len(batch)
+
+    valid = {}
+    for row_number, row in enumerate(batch, start=first_row):
+        user_type = row.get('user_type') or 'student'
+        row['email'] = User.objects.normalize_email(row.get('email', ''))
+        if not (row.get('username') and row.get('email') and row.get('password')):
+            summary['errors'].append({'row': row_number, 'error': 'username, email and password are required'})
+        elif user_type not in USER_TYPES:
+            summary['errors'].append({'row': row_number, 'error': f'Unknown user_type {user_type!r}'})
+        elif error := _field_error(row):
+            summary['errors'].append({'row': row_number, 'error': error})
+        elif row['email'] in valid:
+            summary['errors'].append({'row': row_number, 'error': 'Duplicate email in file'})
+        else:
+            valid[row['email']] = dict(row, user_type=user_type, row=row_number)
+
+    # Two IN queries tell us which rows already exist (resume) or clash with another account
+    existing = dict(User.objects.filter(email__in=list(valid)).values_list('email', 'id'))
+    taken_usernames = set(
+        User.objects.filter(username__in=[row['username'] for row in valid.values()])
+        .exclude(email__in=list(valid)).values_list('username', flat=True)
+    )
+
+    new_rows = []
+    seen_usernames = set()
+    for email, row in valid.items():
+        if email in existing:
+            summary['skipped'] += 1
+        elif row['username'] in taken_usernames or row['username'] in seen_usernames:
+            summary['errors'].append({'row': row['row'], 'error': 'Username already taken'})
+        else:
+            seen_usernames.add(row['username'])
+            new_rows.append(row)
+
+    # PBKDF2 dominates the cost; spread it across workers
+    hashes = hash_passwords([row['password'] for row in new_rows])
+    users = [
+        User(username=row['username'], email=row['email'], user_type=row['user_type'], password=password_hash)
+        for row, password_hash in zip(new_rows, hashes)
+    ]
+
+    with transaction.atomic():
+        created = User.objects.bulk_create(users)
+        summary['created'] += len(created)
+        user_ids = dict(existing)
+        user_ids.update(
+            User.objects.filter(email__in=[user.email for user in created]).values_list('email', 'id')
+        )
+        joined = _enroll(valid, user_ids, default_class_code, summary)
+
+    for class_id in joined:
+        invalidate_class_boards(class_id)
+
+
+def _field_error(row):
+    """Check username and email against the model's validators (format, max_length); returns a message or None"""
+    # bulk_create skips model validation, and one over-long value would abort the whole batch
+    for name in ('username', 'email'):
+        try:
+            User._meta.get_field(name).run_validators(row[name])
+        except ValidationError as e:
+            return f"{name}: {' '.join(e.messages)}"
+    return None
+
+
+def _enroll(valid, user_ids, default_class_code, summary):
+    """Enroll the batch's students into their classes; returns {class_id: [user ids added]}"""
+    wanted = {
+        email: row.get('class_code') or default_class_code
+        for email, row in valid.items()
+        if email in user_ids and (row.get('class_code') or default_class_code)
+    }
+    if not wanted:
+        return {}
+
+    class_ids = dict(Class.objects.filter(code__in=set(wanted.values())).values_list('code', 'id'))
+    Enrollment = Class.students.through
+    wanted_ids = [user_ids[email] for email in wanted]
+    # The stored type, not the row's: a resumed row's account may predate this file
+    students = set(User.objects.filter(id__in=wanted_ids, user_type='student').values_list('id', flat=True))
+    # A student belongs to one class, as AddStudentToClassView enforces
+    enrollments = set(Enrollment.objects.filter(user_id__in=students).values_list('user_id', 'class_id'))
+    enrolled_ids = {user_id for user_id, _ in enrollments}
+
+    joined = defaultdict(list)
+    for email, code in wanted.items():
+        row, user_id = valid[email], user_ids[email]
+        if code not in class_ids:
+            summary['errors'].append({'row': row['row'], 'error': f'Unknown class code {code!r}'})
+        elif user_id not in students:
+            # Teachers and admins in a file with a default class_code are simply not enrolled
+            if row.get('class_code'):
+                summary['errors'].append({'row': row['row'], 'error': 'Only students can be enrolled in a class'})
+        elif user_id in enrolled_ids:
+            # Already in this class means a resumed row, which is not counted again
+            if (user_id, class_ids[code]) not in enrollments:
+                summary['errors'].append({'row': row['row'], 'error': 'Already enrolled in another class'})
+        else:
+            joined[class_ids[code]].append(user_id)
+
+    # ignore_conflicts only covers a concurrent enrollment of the same student
+    Enrollment.objects.bulk_create(
+        [Enrollment(class_id=class_id, user_id=user_id) for class_id, ids in joined.items() for user_id in ids],
+        ignore_conflicts=True,
+    )
+    for class_id, ids in joined.items():
+        GalistLeaderboardBucket.add_class_members(class_id, ids)
+    summary['enrolled'] += sum(map(len, joined.values()))
+    return joined
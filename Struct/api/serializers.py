@@ -26,13 +26,18 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         # Remove confirm_password from the data
         validated_data.pop('confirm_password', None)
 
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
+        user = User(
+            username=User.normalize_username(validated_data['username']),
+            email=User.objects.normalize_email(validated_data['email']),
             user_type=validated_data['user_type']
         )
 
-        user.set_password(validated_data['password'])
+        # Views may hash the password on the hashing pool beforehand
+        if validated_data.get('password_hash'):
+            user.password = validated_data['password_hash']
+        else:
+            user.set_password(validated_data['password'])
+        # Single INSERT instead of create_user() followed by save()
         user.save()
 
         return user
@@ -51,7 +56,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         if user.profile_photo:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(user.profile_photo.url)
+                return request.build_absolute_uri(user.get_profile_photo_thumbnail_url('medium'))
         return None
     
     def get_next_heart_in(self, user):
@@ -83,6 +88,10 @@ class ClassSerializer(serializers.ModelSerializer):
         read_only_fields = ['code']
 
     def get_students_count(self, obj):
+        # Listing views annotate the count in their main query; fall back to a COUNT for single objects
+        students_count = getattr(obj, 'students_count', None)
+        if students_count is not None:
+            return students_count
         return obj.students.count()
 
 class ClassCreateSerializer(serializers.ModelSerializer):
@@ -111,7 +120,7 @@ class GalistLeaderboardSerializer(serializers.ModelSerializer):
         if obj.user.profile_photo:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.user.profile_photo.url)
+                return request.build_absolute_uri(obj.user.get_profile_photo_thumbnail_url())
         return None
     
     def get_formatted_time(self, obj):
@@ -124,4 +133,63 @@ class GalistLeaderboardCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+# Plain-dict equivalents of the read-only serializers above for the hot GET
+# endpoints. They skip DRF's per-field dispatch but must return exactly the
+# same data (see ReadSerializerParityTests).
+
+_datetime_field = serializers.DateTimeField()
+
+
+def serialize_user_profile(user, request):
+    """Same output as UserProfileSerializer(user, context={'request': request}).data"""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'user_type': user.user_type,
+        'profile_photo_url': (
+            request.build_absolute_uri(user.get_profile_photo_thumbnail_url('medium'))
+            if user.profile_photo and request else None
+        ),
+        'points': user.points,
+        'hearts': user.hearts,
+        'max_hearts': user.max_hearts,
+        'hints': user.hints,
+        'next_heart_in': user.get_next_heart_time(),
+        'hearts_gained_today': user.hearts_gained_today,
+        'max_daily_hearts': user.max_daily_hearts,
+    }
+
+
+def serialize_user_hearts(user):
+    """Same output as UserHeartSerializer(user).data"""
+    return {
+        'hearts': user.hearts,
+        'max_hearts': user.max_hearts,
+        'last_heart_regen_time': _datetime_field.to_representation(user.last_heart_regen_time),
+        'next_heart_in': user.get_next_heart_time(),
+        'hearts_gained_today': user.hearts_gained_today,
+        'max_daily_hearts': user.max_daily_hearts,
+    }
+
+
+def serialize_leaderboard_entries(entries, request):
+    """Same output as GalistLeaderboardSerializer(entries, many=True, context={'request': request}).data"""
+    to_datetime = _datetime_field.to_representation
+    return [
+        {
+            'id': entry.id,
+            'username': entry.user.username,
+            'score': entry.score,
+            'time_elapsed': entry.time_elapsed,
+            'formatted_time': entry.get_formatted_time(),
+            'created_at': to_datetime(entry.created_at),
+            'profile_photo_url': (
+                request.build_absolute_uri(entry.user.get_profile_photo_thumbnail_url())
+                if entry.user.profile_photo and request else None
+            ),
+        }
+        for entry in entries
+    ]
@@ -0,0 +1,58 @@
+"""Content-addressed storage for profile photos and their thumbnails.
+
+Files are named by the SHA-256 of their bytes under CONTENT_ADDRESSED_PREFIX,
+so identical uploads share one file and a URL always points at the same
+content. Responses for that prefix can be cached forever, e.g. with nginx:
+
+    location /media/profile_photos/sha256/ {
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+Shared files are never deleted on replace; the prune_profile_photos command
+removes the ones no user references any more.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from PIL import Image, UnidentifiedImageError
+
+CONTENT_ADDRESSED_PREFIX = 'profile_photos/sha256/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that ignores the client's file name and stores by content hash and image format"""
+
+    def __init__(self, prefix=CONTENT_ADDRESSED_PREFIX, **kwargs):
+        self.prefix = prefix
+        super().__init__(**kwargs)
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        name = f'{self.prefix}{digest[:2]}/{digest}{self.image_extension(content)}'
+
+        if self.exists(name):
+            # Duplicate upload: keep the stored copy, and mark it recently used so pruning spares it
+            os.utime(self.path(name))
+            return name
+        content.seek(0)
+        return super().save(name, content, max_length)
+
+    @staticmethod
+    def image_extension(content):
+        # From the decoded format, never the client's file name, so the served type matches the bytes
+        content.seek(0)
+        try:
+            with Image.open(content) as image:
+                image_format = image.format
+        except (UnidentifiedImageError, OSError):
+            return ''
+        return '.jpg' if image_format == 'JPEG' else f'.{image_format.lower()}'
+
+
+def profile_photo_storage():
+    return ContentAddressedStorage()
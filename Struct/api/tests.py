@@ -1,3 +1,409 @@
-from django.test import TestCase
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.files.base import ContentFile
+from django.db import DatabaseError
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from django.utils import timezone
+
+from .hashing import hash_pool
+from .leaderboard_cache import get_leaderboard_cache
+from .models import Class, GalistBestScore, GalistLeaderboard, GalistLeaderboardBucket, HeartSpendConflict, User
+from .points_buffer import PointsWriteBehindBuffer
+from .provisioning import provision_users
+from .serializers import (
+    GalistLeaderboardSerializer, UserHeartSerializer, UserProfileSerializer,
+    serialize_leaderboard_entries, serialize_user_hearts, serialize_user_profile,
+)
+from .storage import ContentAddressedStorage
+from .views import user_event_stream
+
+
+class ReadSerializerParityTests(TestCase):
+    """The plain-dict fast paths must match the DRF serializers field for field"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        cls.with_photo = User.objects.create_user(
+            username='ana', email='ana@example.com', password='pw', user_type='student',
+            hearts=1, hearts_gained_today=1, last_heart_regen_time=cls.now - timezone.timedelta(minutes=12),
+        )
+        cls.with_photo.profile_photo.name = 'profile_photos/sha256/ab/ab12.jpg'
+        cls.with_photo.profile_photo_thumbnails = {
+            'small': 'profile_photos/sha256/cd/cd34.webp', 'medium': 'profile_photos/sha256/ef/ef56.webp',
+        }
+        cls.with_photo.save()
+        cls.without_photo = User.objects.create_user(
+            username='ben', email='ben@example.com', password='pw', user_type='teacher', hearts=10,
+        )
+        for user, score, time_elapsed in [(cls.with_photo, 90, 75), (cls.without_photo, 90, 61), (cls.with_photo, 15, 3600)]:
+            GalistLeaderboard.objects.create(user=user, score=score, time_elapsed=time_elapsed)
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/galist/leaderboard/')
+        # next_heart_in counts down from "now", so both paths must see the same clock
+        patcher = mock.patch('django.utils.timezone.now', return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_user_profile(self):
+        for user in (self.with_photo, self.without_photo):
+            for request in (self.request, None):
+                with self.subTest(user=user.username, request=request):
+                    self.assertEqual(
+                        serialize_user_profile(user, request),
+                        UserProfileSerializer(user, context={'request': request}).data,
+                    )
+
+    def test_user_hearts(self):
+        for user in (self.with_photo, self.without_photo):
+            with self.subTest(user=user.username):
+                self.assertEqual(serialize_user_hearts(user), UserHeartSerializer(user).data)
+
+    def test_leaderboard_entries(self):
+        entries = list(GalistLeaderboard.objects.select_related('user').ranked())
+        for request in (self.request, None):
+            with self.subTest(request=request):
+                self.assertEqual(
+                    serialize_leaderboard_entries(entries, request),
+                    GalistLeaderboardSerializer(entries, many=True, context={'request': request}).data,
+                )
+
+
+class UserClassesViewTests(TestCase):
+    def test_students_count_matches_for_students_and_teacher(self):
+        teacher = User.objects.create_user(username='teach', email='teach@example.com', password='pw', user_type='teacher')
+        class_obj = Class.objects.create(name='Data Structures', teacher=teacher)
+        students = [
+            User.objects.create_user(username=f's{i}', email=f's{i}@example.com', password='pw', user_type='student')
+            for i in range(5)
+        ]
+        class_obj.students.add(*students)
+
+        client = APIClient()
+        client.force_authenticate(students[0])
+        enrolled = client.get('/api/classes/user/').data['enrolled_classes']
+        client.force_authenticate(teacher)
+        teaching = client.get('/api/classes/user/').data['teaching_classes']
+
+        self.assertEqual([c['students_count'] for c in enrolled], [5])
+        self.assertEqual([c['students_count'] for c in teaching], [5])
+
+    def test_roster_is_complete_unless_paged(self):
+        teacher = User.objects.create_user(username='teach', email='teach@example.com', password='pw', user_type='teacher')
+        class_obj = Class.objects.create(name='Big class', teacher=teacher)
+        class_obj.students.add(*[
+            User.objects.create_user(username=f'r{i}', email=f'r{i}@example.com', password='pw', user_type='student')
+            for i in range(60)
+        ])
+        client = APIClient()
+        client.force_authenticate(teacher)
+
+        self.assertEqual(len(client.get(f'/api/classes/{class_obj.id}/students/').data['students']), 60)
+        paged = client.get(f'/api/classes/{class_obj.id}/students/?page=2').data
+        self.assertEqual((len(paged['students']), paged['num_pages']), (10, 2))
+
+    def test_export_streams_asynchronously_under_asgi(self):
+        teacher = User.objects.create_user(username='teach', email='teach@example.com', password='pw', user_type='teacher')
+        class_obj = Class.objects.create(name='Exported', teacher=teacher)
+        class_obj.students.add(*[
+            User.objects.create_user(username=f'x{i}', email=f'x{i}@example.com', password='pw', user_type='student')
+            for i in range(150)
+        ])
+        token = Token.objects.create(user=teacher)
+
+        async def export():
+            response = await self.async_client.get(
+                f'/api/classes/{class_obj.id}/students/', {'export': 'jsonl'}, headers={'Authorization': f'Token {token.key}'}
+            )
+            # An async iterator is streamed as read; a sync one would have been buffered whole
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(async_to_sync(export)().splitlines()), 150)
+
+
+class ConditionalGetTests(TestCase):
+    def test_profile_etag_changes_after_write_from_another_process(self):
+        # Full hearts: no countdown, so responses carry an ETag
+        user = User.objects.create_user(username='cara', email='cara@example.com', password='pw', user_type='student', hearts=10)
+        client = APIClient()
+        client.force_authenticate(user)
+        etag = client.get('/api/user/profile/')['ETag']
+        self.assertEqual(client.get('/api/user/profile/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A queryset UPDATE elsewhere bumps no stamp in this process; the row fields still differ
+        User.objects.filter(pk=user.pk).update(points=999)
+        user.refresh_from_db()
+        client.force_authenticate(user)
+        response = client.get('/api/user/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['points'], 999)
+
+    def test_no_etag_while_a_heart_is_regenerating(self):
+        # Full hearts: no countdown, so responses carry an ETag
+        user = User.objects.create_user(username='cara', email='cara@example.com', password='pw', user_type='student', hearts=10)
+        client = APIClient()
+        client.force_authenticate(user)
+        etag = client.get('/api/user/hearts/')['ETag']
+
+        User.objects.filter(pk=user.pk).update(hearts=0, last_heart_regen_time=timezone.now())
+        user.refresh_from_db()
+        client.force_authenticate(user)
+        response = client.get('/api/user/hearts/', HTTP_IF_NONE_MATCH=etag)
+        # next_heart_in counts down from the response time, so a cached body must not be reused
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertIsNotNone(response.data['next_heart_in'])
+
+
+class SpendHeartsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gus', email='gus@example.com', password='pw', user_type='student')
+
+    def test_lost_race_is_retried_against_the_new_state(self):
+        # Another request spends two of the three hearts after this instance was loaded
+        User.objects.filter(pk=self.user.pk).update(hearts=1)
+        self.assertFalse(self.user.spend_hearts(2))
+        self.assertEqual(self.user.hearts, 1)
+
+        self.assertTrue(self.user.spend_hearts(1))
+        self.assertEqual(User.objects.get(pk=self.user.pk).hearts, 0)
+
+    def test_exhausted_retries_answer_409_not_400(self):
+        User.objects.filter(pk=self.user.pk).update(hearts=1)
+        # Every re-read keeps the stale state, as if each retry lost another race
+        with mock.patch.object(User, 'refresh_from_db'):
+            with self.assertRaises(HeartSpendConflict):
+                self.user.spend_hearts(1)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(User, 'spend_hearts', side_effect=HeartSpendConflict("retry")):
+            response = client.post('/api/user/hearts/', {'hearts_to_use': 1}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+
+@override_settings(AUTH_STATELESS_TOKENS=True)
+class StatelessLogoutTests(TestCase):
+    def test_logout_revokes_refresh_tokens(self):
+        User.objects.create_user(username='hana', email='hana@example.com', password='pw', user_type='student')
+        tokens = self.client.post('/api/login/', {'email': 'hana@example.com', 'password': 'pw'},
+                                  content_type='application/json').json()
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(client.post('/api/logout/').status_code, 200)
+        self.assertEqual(client.post('/api/token/refresh/', {'refresh': tokens['refresh']}, format='json').status_code, 401)
+
+
+class UserProfileUpdateTests(TestCase):
+    def test_patch_keeps_changes_made_since_the_user_was_cached(self):
+        user = User.objects.create_user(username='dana', email='dana@example.com', password='pw', user_type='student')
+        client = APIClient()
+        # Stands in for the auth cache's copy, taken before another worker's write
+        client.force_authenticate(user)
+        User.objects.filter(pk=user.pk).update(points=500, hearts=0)
+
+        response = client.patch('/api/user/profile/', {'username': 'dana2'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual((user.username, user.points, user.hearts), ('dana2', 500, 0))
+
+
+class GalistRankTests(TestCase):
+    def test_default_rank_is_among_players(self):
+        client = APIClient()
+        for name, scores in (('ivy', [90, 80, 70]), ('jay', [60])):
+            user = User.objects.create_user(username=name, email=f'{name}@example.com', password='pw', user_type='student')
+            client.force_authenticate(user)
+            for score in scores:
+                client.post('/api/galist/leaderboard/submit/', {'score': score, 'time_elapsed': 30}, format='json')
+
+        # jay's 60 is behind three of ivy's attempts, but only one player
+        self.assertEqual(client.get('/api/galist/leaderboard/rank/').data['rank'], 2)
+        self.assertEqual(client.get('/api/galist/leaderboard/rank/', {'mode': 'attempts'}).data['rank'], 4)
+
+
+class LeaderboardCacheTests(TestCase):
+    def test_clearing_drops_boards_but_not_other_keys(self):
+        user = User.objects.create_user(username='erin', email='erin@example.com', password='pw', user_type='student')
+        client = APIClient()
+        client.force_authenticate(user)
+        client.post('/api/galist/leaderboard/submit/', {'score': 80, 'time_elapsed': 30}, format='json')
+        self.assertEqual(client.get('/api/galist/leaderboard/').data[0]['username'], 'erin')
+
+        cache = get_leaderboard_cache()
+        cache.set('unrelated', 'kept')
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch('/api/user/profile/', {'username': 'erin2'}, format='json')
+
+        self.assertEqual(client.get('/api/galist/leaderboard/').data[0]['username'], 'erin2')
+        self.assertEqual(cache.get('unrelated'), 'kept')
+
+
+class GalistClassBoardTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teach', email='teach@example.com', password='pw', user_type='teacher')
+        self.class_obj = Class.objects.create(name='Data Structures', teacher=self.teacher)
+        self.student = User.objects.create_user(username='dan', email='dan@example.com', password='pw', user_type='student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def submit(self, score, time_elapsed):
+        response = self.client.post(
+            '/api/galist/leaderboard/submit/', {'score': score, 'time_elapsed': time_elapsed}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return GalistLeaderboard.objects.get(id=response.data['entry']['id'])
+
+    def class_board(self, window='all'):
+        response = self.client.get(f'/api/galist/leaderboard/?class_id={self.class_obj.id}&window={window}')
+        return [row['score'] for row in response.data]
+
+    def test_joining_backfills_and_leaving_removes_class_buckets(self):
+        self.submit(40, 100)
+        self.submit(70, 100)
+
+        self.client.post('/api/classes/join/', {'code': self.class_obj.code}, format='json')
+        self.assertEqual(self.class_board(), [70])
+        self.assertEqual(self.class_board('day'), [70])
+
+        self.client.post(f'/api/classes/leave/{self.class_obj.id}/')
+        self.assertFalse(GalistLeaderboardBucket.objects.filter(class_obj=self.class_obj).exists())
+
+    def test_bucket_rank_is_scoped_to_its_board(self):
+        other = User.objects.create_user(username='eve', email='eve@example.com', password='pw', user_type='student')
+        for score in (90, 80):
+            entry = GalistLeaderboard.objects.create(user=other, score=score, time_elapsed=10)
+            GalistBestScore.record(entry)
+            GalistLeaderboardBucket.record(entry, [self.class_obj.id])
+        self.submit(85, 10)
+
+        day_bucket = GalistLeaderboardBucket.objects.get(user=self.student, period='day', class_obj__isnull=True)
+        self.assertEqual(day_bucket.get_rank(), 2)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def test_extension_comes_from_image_format(self):
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4)).save(buffer, 'PNG')
+        with tempfile.TemporaryDirectory() as location:
+            storage = ContentAddressedStorage(location=location)
+            self.assertTrue(storage.save('photo.html', ContentFile(buffer.getvalue())).endswith('.png'))
+            self.assertFalse(storage.save('notes.html', ContentFile(b'<script>')).endswith('.html'))
+
+
+class ProvisioningTests(TestCase):
+    def test_enrolls_only_students_once(self):
+        teacher = User.objects.create_user(username='teach', email='teach@example.com', password='pw', user_type='teacher')
+        class_obj = Class.objects.create(name='Provisioned', teacher=teacher)
+        other = Class.objects.create(name='Other', teacher=teacher)
+        moved = User.objects.create_user(username='moved', email='moved@example.com', password='pw', user_type='student')
+        other.students.add(moved)
+        rows = [
+            {'username': 's1', 'email': 's1@example.com', 'password': 'pw'},
+            {'username': 't1', 'email': 't1@example.com', 'password': 'pw', 'user_type': 'teacher',
+             'class_code': class_obj.code},
+            {'username': 'moved', 'email': 'moved@example.com', 'password': 'pw'},
+        ]
+
+        summary = provision_users(rows, class_code=class_obj.code, hash_pool=hash_pool)
+        self.assertEqual(summary['enrolled'], 1)
+        self.assertEqual(sorted(e['error'] for e in summary['errors']),
+                         ['Already enrolled in another class', 'Only students can be enrolled in a class'])
+        self.assertEqual(list(class_obj.students.values_list('username', flat=True)), ['s1'])
+
+        # Resuming the same file enrolls nothing new
+        self.assertEqual(provision_users(rows, class_code=class_obj.code, hash_pool=hash_pool)['enrolled'], 0)
+
+    def test_rows_failing_field_validation_are_reported(self):
+        rows = [
+            {'username': 'ok', 'email': 'ok@example.com', 'password': 'pw'},
+            {'username': 'bad', 'email': 'notanemail', 'password': 'pw'},
+            {'username': 'u' * 151, 'email': 'long@example.com', 'password': 'pw'},
+            {'username': 'has space', 'email': 'space@example.com', 'password': 'pw'},
+        ]
+        summary = provision_users(rows, hash_pool=hash_pool)
+        self.assertEqual(summary['created'], 1)
+        self.assertEqual([(error['row'], error['error'].split(':')[0]) for error in summary['errors']],
+                         [(2, 'email'), (3, 'username'), (4, 'username')])
+
+
+class UserEventStreamTests(TestCase):
+    def collect(self, stream):
+        async def drain():
+            return [message async for message in stream]
+        return async_to_sync(drain)()
+
+    def test_stream_ends_when_signed_token_expires(self):
+        user = User.objects.create_user(username='sse', email='sse@example.com', password='pw')
+        messages = self.collect(user_event_stream(user, expires_at=time.time()))
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith('event: hearts'))
+
+    def test_refused_under_wsgi(self):
+        # WSGI would read the endless stream into memory before sending a byte
+        self.assertEqual(self.client.get('/api/user/events/').status_code, 501)
+
+    def test_rejects_unknown_token_under_asgi(self):
+        response = async_to_sync(self.async_client.get)('/api/user/events/', {'token': 'unknown'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_ends_after_logout(self):
+        user = User.objects.create_user(username='sse', email='sse@example.com', password='pw')
+        with mock.patch('api.views.KEEPALIVE_SECONDS', 0):
+            self.assertEqual(len(self.collect(user_event_stream(user, token_key='deleted'))), 1)
+
+
+class PointsWriteBehindBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='finn', email='finn@example.com', password='pw', user_type='student')
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        self.journal_dir = Path(journal_dir.name)
+
+    def start_buffer(self):
+        points_buffer = PointsWriteBehindBuffer(self.journal_dir, flush_interval=3600, fsync=False)
+        points_buffer.start()
+        self.addCleanup(points_buffer.stop)
+        return points_buffer
+
+    def test_recovers_journals_left_by_a_dead_process(self):
+        # A torn last line was never acknowledged, so it is skipped
+        (self.journal_dir / 'points-1-dead.log').write_text(f'{self.user.id} 5 1\n{self.user.id} 3 1\n{self.user.id} 9')
+        self.start_buffer()
+
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.points, self.user.quiz_attempts), (8, 2))
+        self.assertFalse((self.journal_dir / 'points-1-dead.log').exists())
+
+    def test_failed_flush_keeps_deltas_and_journals(self):
+        points_buffer = self.start_buffer()
+        points_buffer.add(self.user.id, 10)
+        with mock.patch('api.points_buffer.apply_point_deltas', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                points_buffer.flush()
+        self.assertEqual(points_buffer.pending_for(self.user.id), (10, 1))
+        self.assertEqual(len(list(self.journal_dir.glob('*.log'))), 2)
+
+        points_buffer.add(self.user.id, 5)
+        self.assertEqual(points_buffer.flush(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.points, self.user.quiz_attempts), (15, 2))
+        # Only the fresh, empty journal is left
+        self.assertEqual(len(list(self.journal_dir.glob('*.log'))), 1)
+
+    def test_read_through_adds_unflushed_deltas(self):
+        points_buffer = self.start_buffer()
+        points_buffer.add(self.user.id, 7)
+
+        self.assertEqual(points_buffer.read_through(self.user), (7, 1))
+        self.assertEqual(User.objects.get(pk=self.user.pk).points, 0)
@@ -1,13 +1,19 @@
 # api/urls.py
 from django.urls import path
-from .views import UserRegistrationView, LoginView, ClassCreateView, JoinClassView, UserClassesView, DeleteClassView, LeaveClassView, UserHeartsView, PointsUpdateView, GalistLeaderboardView, GalistLeaderboardSubmitView, UserGalistScoresView
+from .views import UserRegistrationView, LoginView, ClassCreateView, JoinClassView, UserClassesView, DeleteClassView, LeaveClassView, UserHeartsView, PointsUpdateView, GalistLeaderboardView, GalistLeaderboardSubmitView, GalistLeaderboardRankView, UserGalistScoresView
 from . import views
+from rest_framework_simplejwt.views import TokenRefreshView
 
 # These URLs will be included under the /api/ prefix
 urlpatterns = [
     # Authentication
     path('register/', UserRegistrationView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', views.LogoutView.as_view(), name='logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('admin/provision-users/', views.ProvisionUsersView.as_view(), name='provision_users'),
+    path('metrics/password-hashing/', views.PasswordHashMetricsView.as_view(), name='password_hash_metrics'),
+    path('metrics/db-pool/', views.DatabasePoolMetricsView.as_view(), name='db_pool_metrics'),
 
     # Profile Management
     path('user/profile/', views.UserProfileView.as_view(), name='user_profile'),
@@ -15,6 +21,7 @@ urlpatterns = [
 
     # Heart Management
     path('user/hearts/', UserHeartsView.as_view(), name='user_hearts'),
+    path('user/events/', views.user_events, name='user_events'),
 
     # Class Management
     path('classes/create/', ClassCreateView.as_view(), name='create_class'),
@@ -25,6 +32,7 @@ urlpatterns = [
 
     path('classes/<int:class_id>/students/', views.ClassStudentsView.as_view(), name='class_students'),
     path('classes/<int:class_id>/add-student/', views.AddStudentToClassView.as_view(), name='add_student_to_class'),
+    path('classes/<int:class_id>/add-students/', views.BulkAddStudentsToClassView.as_view(), name='bulk_add_students_to_class'),
     path('classes/<int:class_id>/remove-student/<int:student_id>/', views.RemoveStudentFromClassView.as_view(), name='remove_student_from_class'),
 
 
@@ -34,5 +42,6 @@ urlpatterns = [
     # Galist Leaderboard
     path('galist/leaderboard/', GalistLeaderboardView.as_view(), name='galist_leaderboard'),
     path('galist/leaderboard/submit/', GalistLeaderboardSubmitView.as_view(), name='galist_leaderboard_submit'),
+    path('galist/leaderboard/rank/', GalistLeaderboardRankView.as_view(), name='galist_leaderboard_rank'),
     path('galist/user-scores/', UserGalistScoresView.as_view(), name='user_galist_scores'),
 ]
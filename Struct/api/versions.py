@@ -0,0 +1,101 @@
+"""Version stamps for conditional GETs.
+
+Each user and the Galist leaderboard has an opaque version in the
+VERSION_CACHE cache that is replaced whenever the data behind it changes.
+Views build their ETag from these stamps, plus anything that changes with
+time alone (such as regenerated hearts). User ETags also include the row
+fields the response shows, which request.user already holds. An
+If-None-Match request is answered with 304 before any serializer runs or
+main table is queried. User responses get no ETag while a heart is
+regenerating: their next_heart_in countdown is relative to the response time,
+so a reused body would restart the client's timer.
+
+Writes made by another process only bump that process's stamps unless
+VERSION_CACHE is shared. Stamps therefore expire after VERSION_CACHE_TIMEOUT
+seconds, which bounds how long such a write can go unnoticed. An expired or
+evicted stamp is simply recreated, which costs one full response.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+LEADERBOARD_VERSION_KEY = 'version:galist-leaderboard'
+
+
+def get_version_cache():
+    return caches[settings.VERSION_CACHE]
+
+
+def user_version_key(user_id):
+    return f'version:user:{user_id}'
+
+
+def get_version(key):
+    cache = get_version_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, settings.VERSION_CACHE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(*keys):
+    get_version_cache().set_many({key: uuid.uuid4().hex for key in keys}, settings.VERSION_CACHE_TIMEOUT)
+
+
+def bump_after_commit(key):
+    # A poll racing the write must not pair the old data with the new stamp
+    transaction.on_commit(lambda: bump_versions(key))
+
+
+def bump_user_version(user_id):
+    bump_after_commit(user_version_key(user_id))
+
+
+def bump_leaderboard_version():
+    bump_after_commit(LEADERBOARD_VERSION_KEY)
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def user_etag(user, fields, *parts):
+    """ETag for a response built from `fields` of `user`'s row, including hearts regenerated since the last write.
+
+    Returns None, meaning "always send the full response", while the next heart is counting down.
+    """
+    state = user.get_heart_state()
+    if state['hearts'] < user.max_hearts and state['hearts_gained_today'] < user.max_daily_hearts:
+        return None
+    # hearts_reset_date is left out: a pending daily reset derives it as "now" on every call
+    return make_etag(
+        get_version(user_version_key(user.id)),
+        *(getattr(user, field) for field in fields),
+        state['hearts'], state['hearts_gained_today'], state['last_heart_regen_time'].isoformat(),
+        *parts,
+    )
+
+
+def not_modified(request, etag):
+    """Return a 304 Response if the client already has `etag`, else None"""
+    if etag is None:
+        return None
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in etags or '*' in etags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=conditional_headers(etag))
+    return None
+
+
+def conditional_headers(etag):
+    # Clients and proxies must revalidate, but may reuse the body on a 304
+    headers = {'Cache-Control': 'private, no-cache'}
+    if etag is not None:
+        headers['ETag'] = etag
+    return headers
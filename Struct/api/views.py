@@ -1,71 +1,148 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.authtoken.models import Token
-from django.contrib.auth import authenticate
-from django.db.models import Max, F, Avg
-from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from django.conf import settings
+from django.db.models import Count
 
 from .serializers import UserRegistrationSerializer, UserProfileSerializer, ClassSerializer, ClassCreateSerializer, UserHeartSerializer, GalistLeaderboardCreateSerializer, GalistLeaderboardSerializer
-from .models import Class, User, GalistLeaderboard
+from .serializers import serialize_leaderboard_entries, serialize_user_hearts, serialize_user_profile
+from .models import Class, User, GalistLeaderboard, GalistBestScore, GalistLeaderboardBucket, HeartSpendConflict, profile_photo_name
+from .photos import save_profile_photo, InvalidPhoto
 from .serializers import ClassSerializer, ClassCreateSerializer
-
-from django.core.files.storage import default_storage
-from django.db import transaction
+from .pagination import GalistKeysetPagination, InvalidCursor
+from .events import broker, notify_user, format_event, KEEPALIVE_SECONDS
+from .points_buffer import get_points_buffer
+from .authentication import invalidate_cached_user
+from .hashing import hash_pool, HashPoolFull
+from .provisioning import iter_provision_users, read_user_rows
+from .leaderboard_cache import (
+    BEST_BOARD, ENTRIES_BOARD, bucket_board, clear_leaderboard_cache, get_first_page, invalidate_class_boards,
+    invalidate_for_entry,
+)
+from .versions import (
+    LEADERBOARD_VERSION_KEY, bump_leaderboard_version, conditional_headers, get_version, make_etag, not_modified,
+    user_etag,
+)
+
+from django.db import connection, transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.paginator import Paginator
+from django.contrib.auth.hashers import make_password
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+import asyncio
+import csv
+import io
+import itertools
+import json
+import time
+from urllib.parse import urljoin
 
 
 from datetime import timedelta
 
 
 
-class UserRegistrationView(generics.CreateAPIView):
-    serializer_class = UserRegistrationSerializer
-    permission_classes = [AllowAny]
-
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.save()
-            return Response({
-                "success": True,
-                "message": "User created successfully",
-                "user": {
-                    "id": user.id,
-                    "username": user.username,
-                    "email": user.email,
-                    "user_type": user.user_type
-                }
-            }, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-class LoginView(APIView):
-    permission_classes = [AllowAny]
-
-    def post(self, request):
-        email = request.data.get('email')
-        password = request.data.get('password')
+def read_request_data(request):
+    """Parse a JSON or form body for the plain (non-DRF) async views"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST.dict()
+
+class AsyncAPIView(View):
+    """Base for async JSON endpoints that must not block the ASGI event loop.
+
+    DRF views are synchronous, so login and registration are plain Django async
+    views; like DRF views they are exempt from CSRF because they use tokens.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+class UserRegistrationView(AsyncAPIView):
+    async def post(self, request):
+        data = read_request_data(request)
+        if data is None:
+            return JsonResponse({'error': 'Invalid request body'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = UserRegistrationSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Hash on the worker pool, then create the user with a single INSERT
+        try:
+            password_hash = await hash_pool.run(make_password, serializer.validated_data['password'])
+        except HashPoolFull as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+        user = await sync_to_async(serializer.save)(password_hash=password_hash)
+
+        return JsonResponse({
+            "success": True,
+            "message": "User created successfully",
+            "user": {
+                "id": user.id,
+                "username": user.username,
+                "email": user.email,
+                "user_type": user.user_type
+            }
+        }, status=status.HTTP_201_CREATED)
+
+class LoginView(AsyncAPIView):
+    async def post(self, request):
+        data = read_request_data(request) or {}
+        email = data.get('email')
+        password = data.get('password')
 
         if not email or not password:
-            return Response({'error': 'Please provide both email and password'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'Please provide both email and password'},
+                                status=status.HTTP_400_BAD_REQUEST)
 
-        user = authenticate(username=email, email=email, password=password)
+        user = await User.objects.filter(email=email).afirst()
+        try:
+            if user is None:
+                # Hash anyway so unknown emails take as long as wrong passwords (as ModelBackend does)
+                await hash_pool.run(make_password, password)
+            elif not await hash_pool.run(user.check_password, password) or not user.is_active:
+                user = None
+        except HashPoolFull as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
 
         if not user:
-            return Response({'error': 'Invalid credentials'},
-                            status=status.HTTP_401_UNAUTHORIZED)
-
-        token, created = Token.objects.get_or_create(user=user)
+            return JsonResponse({'error': 'Invalid credentials'},
+                                status=status.HTTP_401_UNAUTHORIZED)
+
+        if settings.AUTH_STATELESS_TOKENS:
+            # Signed tokens: later requests are verified without the token table
+            # Also records the token in the blacklist app's outstanding list, a database write
+            refresh = await sync_to_async(RefreshToken.for_user)(user)
+            tokens = {'access': str(refresh.access_token), 'refresh': str(refresh), 'token_type': 'Bearer'}
+        else:
+            token, created = await Token.objects.aget_or_create(user=user)
+            tokens = {'token': token.key}
+        user.regenerate_hearts()
 
         # Include profile photo URL if available
         profile_photo_url = None
         if user.profile_photo:
-            profile_photo_url = request.build_absolute_uri(user.profile_photo.url)
+            profile_photo_url = request.build_absolute_uri(user.get_profile_photo_thumbnail_url('medium'))
 
-        return Response({
-            'token': token.key,
+        return JsonResponse({
+            **tokens,
             'user_id': user.id,
             'email': user.email,
             'username': user.username,
@@ -76,6 +153,65 @@ class LoginView(APIView):
             'hints': user.hints
         }, status=status.HTTP_200_OK)
 
+class ProvisionUsersView(APIView):
+    """Admin bulk user import: streams one JSON progress line per batch"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        if 'file' not in request.FILES:
+            return Response({'error': 'No CSV file provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            batch_size = min(max(int(request.data.get('batch_size', 500)), 1), 5000)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid batch_size'}, status=status.HTTP_400_BAD_REQUEST)
+
+        csv_file = io.TextIOWrapper(request.FILES['file'].file, encoding='utf-8-sig', newline='')
+        progress = iter_provision_users(
+            read_user_rows(csv_file), batch_size=batch_size, class_code=request.data.get('class_code') or None,
+            # Never fork a process pool inside a web worker; large imports belong to the provision_users command
+            hash_pool=hash_pool,
+        )
+        lines = (json.dumps(summary) + '\n' for summary in progress)
+        return StreamingHttpResponse(streamable(request, lines), content_type='application/x-ndjson')
+
+class PasswordHashMetricsView(APIView):
+    """Queue depth and throughput of the password hashing pool"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(hash_pool.stats())
+
+class DatabasePoolMetricsView(APIView):
+    """Connection pool stats, or the persistent-connection settings when pooling is off"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        if not settings.DB_POOL:
+            return Response({
+                "pooling": False,
+                "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+                "health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+            })
+        return Response({"pooling": True, **connection.pool.get_stats()})
+
+class LogoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if settings.AUTH_STATELESS_TOKENS:
+            # Signed tokens can't be deleted. Like deleting the Token below, this logs out every
+            # device: their refresh tokens are blacklisted, so token/refresh/ rejects them.
+            # Access tokens stay valid until they expire (ACCESS_TOKEN_LIFETIME).
+            outstanding = OutstandingToken.objects.filter(user=request.user, blacklistedtoken__isnull=True)
+            BlacklistedToken.objects.bulk_create(
+                [BlacklistedToken(token=token) for token in outstanding], ignore_conflicts=True
+            )
+
+        # Deleting the token also drops it from the auth cache
+        Token.objects.filter(user=request.user).delete()
+        return Response({"success": True, "message": "Logged out successfully"}, status=status.HTTP_200_OK)
+
 class ClassCreateView(generics.CreateAPIView):
     serializer_class = ClassCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -95,16 +231,19 @@ class JoinClassView(APIView):
         try:
             class_obj = Class.objects.get(code=code)
 
-            # If user is already enrolled or is the teacher
-            if request.user in class_obj.students.all() or class_obj.teacher == request.user:
+            # If user is already enrolled or is the teacher (EXISTS on the enrollment table)
+            if class_obj.teacher_id == request.user.id or class_obj.students.filter(id=request.user.id).exists():
                 return Response({
                     "success": True,
                     "message": "You are already enrolled in this class",
                     "class": ClassSerializer(class_obj).data
                 })
 
-            # Add user to the class
-            class_obj.students.add(request.user)
+            # Add user to the class; their earlier scores join its boards
+            with transaction.atomic():
+                class_obj.students.add(request.user)
+                GalistLeaderboardBucket.add_class_members(class_obj.id, [request.user.id])
+            invalidate_class_boards(class_obj.id)
 
             return Response({
                 "success": True,
@@ -122,11 +261,13 @@ class UserClassesView(APIView):
         user = request.user
         user_classes = {}
 
-        # Get classes where user is a student
-        enrolled_classes = user.enrolled_classes.all()
+        # Get classes where user is a student. The count needs its own join: annotating the
+        # related manager would reuse the students=user join and always count 1.
+        enrolled_classes = Class.objects.filter(id__in=user.enrolled_classes.values('id')) \
+            .annotate(students_count=Count('students'))
 
         # Get classes where user is a teacher
-        teaching_classes = user.teaching_classes.all()
+        teaching_classes = user.teaching_classes.annotate(students_count=Count('students'))
 
         return Response({
             "enrolled_classes": ClassSerializer(enrolled_classes, many=True).data,
@@ -160,12 +301,15 @@ class LeaveClassView(APIView):
             class_obj = Class.objects.get(pk=pk)
 
             # Check if user is enrolled in the class
-            if request.user not in class_obj.students.all():
+            if not class_obj.students.filter(id=request.user.id).exists():
                 return Response({"error": "You are not enrolled in this class"},
                                status=status.HTTP_400_BAD_REQUEST)
 
-            # Remove student from class
-            class_obj.students.remove(request.user)
+            # Remove student from class, and from its leaderboards
+            with transaction.atomic():
+                class_obj.students.remove(request.user)
+                GalistLeaderboardBucket.remove_class_members(class_obj.id, [request.user.id])
+            invalidate_class_boards(class_obj.id)
 
             return Response({
                 "success": True,
@@ -185,18 +329,14 @@ def update_profile_photo(request):
 
     user = request.user
 
-    # Delete old profile photo if it exists
-    if user.profile_photo and hasattr(user.profile_photo, 'path') and default_storage.exists(user.profile_photo.path):
-        default_storage.delete(user.profile_photo.path)
-
-    # Save new photo
-    user.profile_photo = request.FILES['photo']
-    user.save()
+    # Stores the original and queues thumbnails; the old file is left for prune_profile_photos
+    try:
+        save_profile_photo(user, request.FILES['photo'])
+    except InvalidPhoto as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Return the URL of the uploaded photo
-    profile_photo_url = None
-    if user.profile_photo:
-        profile_photo_url = request.build_absolute_uri(user.profile_photo.url)
+    # The original until thumbnails are ready, unless a duplicate upload reused existing ones
+    profile_photo_url = request.build_absolute_uri(user.get_profile_photo_thumbnail_url('medium'))
 
     return Response({
         'success': True,
@@ -207,21 +347,44 @@ def update_profile_photo(request):
 class UserProfileView(APIView):
     """API endpoint to get user profile data"""
     permission_classes = [IsAuthenticated]
+    # Row fields the profile shows besides hearts, which user_etag always covers
+    ETAG_FIELDS = (
+        'username', 'email', 'user_type', 'profile_photo', 'profile_photo_thumbnails',
+        'points', 'hints', 'max_hearts', 'max_daily_hearts',
+    )
 
     def get(self, request):
-        # Regenerate hearts before returning profile data
+        # Points still buffered in write-behind mode are part of the response
+        points_buffer = get_points_buffer()
+        pending = points_buffer.pending_for(request.user.id) if points_buffer else None
+
+        # Unchanged since the client's copy: answer from the version stamp and the cached user alone
+        etag = user_etag(request.user, self.ETAG_FIELDS, 'profile', pending)
+        response = not_modified(request, etag)
+        if response:
+            return response
+
+        # Regenerate hearts before returning profile data (in memory only)
         request.user.regenerate_hearts()
+
+        if points_buffer:
+            points_buffer.read_through(request.user)
         
-        serializer = UserProfileSerializer(request.user, context={'request': request})
-        return Response(serializer.data)
+        return Response(serialize_user_profile(request.user, request), headers=conditional_headers(etag))
 
     def patch(self, request):
         """Update user profile data"""
-        serializer = UserProfileSerializer(request.user, data=request.data, partial=True, context={'request': request})
-        if serializer.is_valid():
+        with transaction.atomic():
+            # request.user may be the auth cache's copy; saving it would write back stale points and hearts
+            user = User.objects.select_for_update().get(pk=request.user.pk)
+            serializer = UserProfileSerializer(user, data=request.data, partial=True, context={'request': request})
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             serializer.save()
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            # Usernames appear on the leaderboard
+            bump_leaderboard_version()
+            transaction.on_commit(clear_leaderboard_cache)
+        return Response(serializer.data)
 
 
 class UserHeartsView(APIView):
@@ -230,32 +393,15 @@ class UserHeartsView(APIView):
 
     def get(self, request):
         user = request.user
-        
-        now = timezone.now()
-        
-        # Update last_heart_regen_time in TWO situations:
-        # 1. If hearts are full, update regen time to now to prevent instant regeneration later
-        # 2. If hearts_gained_today is manually reset to 0
-        
-        if user.hearts >= user.max_hearts:
-            # If hearts are full, always set last_heart_regen_time to now
-            # This prevents instant regeneration when hearts go below max
-            user.last_heart_regen_time = now
-            user.save(update_fields=['last_heart_regen_time'])
-        elif user.hearts_gained_today == 0 and user.hearts < user.max_hearts:
-            # Handle manual database reset of hearts_gained_today
-            # Check if last_heart_regen_time is too old (would allow instant regeneration)
-            time_diff = (now - user.last_heart_regen_time).total_seconds() / 60
-            if time_diff >= 30:  # If it would regenerate at least 1 heart
-                # Update last_heart_regen_time to now - forces waiting 30 mins for next heart
-                user.last_heart_regen_time = now
-                user.save(update_fields=['last_heart_regen_time'])
-
-        # Check and regenerate hearts based on time elapsed
+        etag = user_etag(user, ('max_hearts', 'max_daily_hearts'), 'hearts')
+        response = not_modified(request, etag)
+        if response:
+            return response
+
+        # Current hearts are derived from the stored timestamps; reads never write
         user.regenerate_hearts()
         
-        serializer = UserHeartSerializer(user, context={'request': request})
-        return Response(serializer.data)
+        return Response(serialize_user_hearts(user), headers=conditional_headers(etag))
 
     def post(self, request):
         """Endpoint to use a heart (decrement count)"""
@@ -268,14 +414,18 @@ class UserHeartsView(APIView):
         if hearts_to_use <= 0:
             return Response({"error": "hearts_to_use must be positive"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if user.hearts < hearts_to_use:
+        # Regeneration and the spend are applied in one conditional UPDATE
+        try:
+            spent = user.spend_hearts(hearts_to_use)
+        except HeartSpendConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+        if not spent:
             return Response(
                 {"error": "Not enough hearts available", "hearts": user.hearts},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        user.hearts -= hearts_to_use
-        user.save(update_fields=['hearts'])
+        invalidate_cached_user(user.id)
+        notify_user(user.id)
         
         serializer = UserHeartSerializer(user, context={'request': request})
         return Response(serializer.data)
@@ -286,62 +436,264 @@ class PointsUpdateView(APIView):
     def post(self, request):
         points_to_add = request.data.get('score', 0)  # Changed 'points' to 'score' to match frontend
         quiz_type = request.data.get('quiz_type', 'unknown')
-        user = request.user
         
-        # Use atomic transaction to ensure both updates happen together
-        with transaction.atomic():
-            # Update points and quiz attempts atomically
-            user.points = F('points') + points_to_add
-            user.quiz_attempts = F('quiz_attempts') + 1
-            user.save(update_fields=['points', 'quiz_attempts'])
-            
-            # Refresh user object to get updated values
-            user.refresh_from_db()
+        # Only whole, non-negative scores (JSON may send 5.0 for 5)
+        if isinstance(points_to_add, bool) or not isinstance(points_to_add, (int, float)) \
+                or points_to_add < 0 or points_to_add != int(points_to_add):
+            return Response({
+                'success': False,
+                'error': 'Invalid score value'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        points_to_add = int(points_to_add)
+        
+        points_buffer = get_points_buffer()
+        if points_buffer:
+            # Write-behind mode: journal the delta now, the flush thread updates the row
+            points_buffer.add(request.user.id, points_to_add)
+            total_points, attempts = points_buffer.read_through(request.user)
+        else:
+            # Points and quiz attempts are updated and read back in a single statement
+            total_points, attempts = request.user.add_quiz_points(points_to_add)
+            invalidate_cached_user(request.user.id)
+            notify_user(request.user.id)
         
         return Response({
             'success': True,
             'points_added': points_to_add,
-            'total_points': user.points,
-            'attempts': user.quiz_attempts,
+            'total_points': total_points,
+            'attempts': attempts,
             'quiz_type': quiz_type
         }, status=status.HTTP_200_OK)
     
+async def user_events(request):
+    """Server-Sent Events stream of the user's hearts and points.
+
+    EventSource cannot send an Authorization header, so the token may also be
+    passed as ?token=. A query string ends up in server and proxy access logs,
+    so prefer short-lived signed tokens here, or strip the parameter from the
+    logs. The stream closes once a signed token expires or, for table tokens,
+    once the token is deleted (logout). It only works through backend/asgi.py:
+    WSGI (including runserver) reads an async stream to the end before sending
+    anything, so such requests are refused.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'The event stream needs the ASGI server (backend/asgi.py); poll /api/user/hearts/ instead'},
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+        )
+
+    header = request.headers.get('Authorization', '')
+    key = request.GET.get('token') or header.removeprefix('Token ').removeprefix('Bearer ').strip()
+    try:
+        if settings.AUTH_STATELESS_TOKENS and key.count('.') == 2:
+            # Signed access token: verify it and load the user it names
+            token = AccessToken(key)
+            user = await User.objects.aget(
+                **{jwt_settings.USER_ID_FIELD: token[jwt_settings.USER_ID_CLAIM]}, is_active=True
+            )
+            stream = user_event_stream(user, expires_at=token['exp'])
+        else:
+            user = (await Token.objects.select_related('user').aget(key=key)).user
+            stream = user_event_stream(user, token_key=key)
+    except (Token.DoesNotExist, User.DoesNotExist, TokenError, KeyError):
+        return JsonResponse({'detail': 'Invalid token.'}, status=status.HTTP_401_UNAUTHORIZED)
+    finally:
+        await sync_to_async(release_connection)()
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+async def user_event_stream(user, expires_at=None, token_key=None):
+    """Yield a `hearts` event whenever the user's hearts or points change.
+
+    The stream sleeps until the next heart is due, a keep-alive is needed, or a
+    view reports a change through notify_user. Regeneration is derived in memory,
+    so only that last case reads the user row. The stream ends at `expires_at`
+    (a Unix time) or once Token `token_key` is gone, which is checked on every
+    wake-up; logout notifies the stream so it is noticed at once. The database
+    connection is released after each wake-up rather than held until the
+    stream closes.
+    """
+    subscriber = broker.subscribe(user.id)
+    _, changed = subscriber
+    last_state = None
+    try:
+        while True:
+            user.regenerate_hearts()
+            data = dict(serialize_user_hearts(user), points=user.points)
+            # next_heart_in is a countdown the client runs locally; only real changes are sent
+            state = {key: value for key, value in data.items() if key != 'next_heart_in'}
+            if state != last_state:
+                last_state = state
+                yield format_event('hearts', data)
+            else:
+                yield ': keep-alive\n\n'
+
+            timeout = KEEPALIVE_SECONDS
+            next_heart_in = user.get_next_heart_time()
+            if next_heart_in is not None:
+                # Small margin so the interval has fully elapsed when we wake
+                timeout = min(timeout, next_heart_in / 1000 + 0.05)
+            if expires_at is not None:
+                timeout = min(timeout, max(expires_at - time.time(), 0))
+
+            try:
+                await asyncio.wait_for(changed.get(), timeout)
+                woken = True
+            except asyncio.TimeoutError:
+                woken = False
+
+            if expires_at is not None and time.time() >= expires_at:
+                return
+            if (token_key is not None or woken) and not await sync_to_async(reload_stream_user)(user, token_key, woken):
+                return
+    finally:
+        broker.unsubscribe(user.id, subscriber)
+
+def reload_stream_user(user, token_key, reload):
+    """Database part of an event stream wake-up; returns False once Token `token_key` is gone"""
+    try:
+        if token_key is not None and not Token.objects.filter(key=token_key).exists():
+            return False
+        if reload:
+            user.refresh_from_db()
+        return True
+    finally:
+        release_connection()
+
+def release_connection():
+    # request_finished only fires when a stream ends; don't hold a connection (or pool slot) until then
+    if not connection.in_atomic_block:
+        connection.close()
+
 class ClassStudentsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+
+    # Only the columns the roster shows are read from api_user
+    ROSTER_FIELDS = ('id', 'username', 'email', 'date_joined', 'points', 'profile_photo', 'profile_photo_thumbnails')
+    SORT_FIELDS = ('username', 'points', 'date_joined')
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
     
     def get(self, request, class_id):
-        """Get all students in a class"""
+        """Get the students in a class (one page with ?page=/?page_size=), or stream them with ?export=csv|jsonl"""
         try:
             # Verify the class exists and user has access (must be the teacher)
             class_obj = Class.objects.get(id=class_id)
             
-            if request.user != class_obj.teacher:
+            if request.user.id != class_obj.teacher_id:
                 return Response(
                     {"error": "You don't have permission to view this class's students"},
                     status=status.HTTP_403_FORBIDDEN
                 )
-                
-            # Get all students in the class
-            students = class_obj.students.all()
-            student_data = []
-            
-            for student in students:
-                student_data.append({
-                    "id": student.id,
-                    "username": student.username,
-                    "email": student.email,
-                    "date_joined": student.date_joined,
-                    "profile_photo_url": request.build_absolute_uri(student.profile_photo.url) if student.profile_photo else None
-                })
-                
-            return Response({"students": student_data})
-            
         except Class.DoesNotExist:
             return Response(
                 {"error": "Class not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        # ?sort=points, ?sort=-date_joined, ... with id as a stable tie-breaker
+        sort = request.query_params.get('sort', 'username')
+        if sort.lstrip('-') not in self.SORT_FIELDS:
+            return Response(
+                {"error": f"sort must be one of {', '.join(self.SORT_FIELDS)} (prefix with - for descending)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        students = class_obj.students.order_by(sort, 'id').values(*self.ROSTER_FIELDS)
+
+        export = request.query_params.get('export')
+        if export:
+            return self.export(request, class_obj, students, export)
+
+        photo_url = self.photo_url_builder(request)
+
+        if 'page' not in request.query_params and 'page_size' not in request.query_params:
+            # Clients that don't page (ManageStudentsModal) still get the whole roster
+            student_data = [photo_url(student) for student in students]
+            return Response({
+                "students": student_data,
+                "count": len(student_data),
+                "page": 1,
+                "num_pages": 1
+            })
+
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', self.DEFAULT_PAGE_SIZE)), 1), self.MAX_PAGE_SIZE)
+        except ValueError:
+            page_size = self.DEFAULT_PAGE_SIZE
+        page = Paginator(students, page_size).get_page(request.query_params.get('page'))
+
+        student_data = [photo_url(student) for student in page]
+
+        return Response({
+            "students": student_data,
+            "count": page.paginator.count,
+            "page": page.number,
+            "num_pages": page.paginator.num_pages
+        })
+
+    def photo_url_builder(self, request):
+        """Return a function replacing a roster row's photo columns with its thumbnail URL"""
+        # Resolve the host once instead of calling build_absolute_uri per student
+        base_url = request.build_absolute_uri('/')
+        storage = User._meta.get_field('profile_photo').storage
+
+        def photo_url(student):
+            name = profile_photo_name(student.pop('profile_photo'), student.pop('profile_photo_thumbnails'))
+            student['profile_photo_url'] = urljoin(base_url, storage.url(name)) if name else None
+            return student
+        return photo_url
+
+    def export(self, request, class_obj, students, export_format):
+        """Stream the whole roster while it is read, chunk by chunk"""
+        if export_format not in ('csv', 'jsonl'):
+            return Response({"error": "export must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+
+        photo_url = self.photo_url_builder(request)
+        rows = (photo_url(student) for student in students.iterator(chunk_size=500))
+
+        if export_format == 'csv':
+            columns = ['id', 'username', 'email', 'date_joined', 'points', 'profile_photo_url']
+            writer = csv.writer(EchoBuffer())
+            lines = itertools.chain(
+                [writer.writerow(columns)],
+                (writer.writerow([row[column] for column in columns]) for row in rows),
+            )
+            content_type = 'text/csv'
+        else:
+            lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+            content_type = 'application/x-ndjson'
+
+        response = StreamingHttpResponse(streamable(request, lines), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="class-{class_obj.code}-students.{export_format}"'
+        return response
+
+class EchoBuffer:
+    """File-like object whose write() just returns the value, so csv.writer can feed a stream"""
+    def write(self, value):
+        return value
+
+def streamable(request, iterable, chunk_size=100):
+    """Return `iterable` in the form the serving handler streams without buffering it.
+
+    Under ASGI, StreamingHttpResponse reads a sync iterator into a list before
+    sending anything, so the items are pulled on the worker thread in chunks by
+    an async generator instead. WSGI does the reverse, so it gets `iterable`.
+    """
+    if not isinstance(getattr(request, '_request', request), ASGIRequest):
+        return iterable
+    iterator = iter(iterable)
+    # thread_sensitive: the request's thread, whose connection holds the queryset's cursor
+    next_chunk = sync_to_async(lambda: list(itertools.islice(iterator, chunk_size)))
+
+    async def chunks():
+        while chunk := await next_chunk():
+            for item in chunk:
+                yield item
+    return chunks()
+
 class AddStudentToClassView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
@@ -379,8 +731,11 @@ class AddStudentToClassView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
                 
-            # Add student to class
-            class_obj.students.add(student)
+            # Add student to class; their earlier scores join its boards
+            with transaction.atomic():
+                class_obj.students.add(student)
+                GalistLeaderboardBucket.add_class_members(class_obj.id, [student.id])
+            invalidate_class_boards(class_obj.id)
             
             return Response({
                 "success": True,
@@ -398,6 +753,95 @@ class AddStudentToClassView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+class BulkAddStudentsToClassView(APIView):
+    """Add many students to a class from a list of emails or an uploaded CSV"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    MAX_EMAILS = 1000
+    
+    def post(self, request, class_id):
+        try:
+            class_obj = Class.objects.get(id=class_id)
+        except Class.DoesNotExist:
+            return Response(
+                {"error": "Class not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        if request.user.id != class_obj.teacher_id:
+            return Response(
+                {"error": "You don't have permission to add students to this class"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if 'file' in request.FILES:
+            emails = self.read_csv_emails(request.FILES['file'])
+        else:
+            emails = request.data.get('emails')
+            if not isinstance(emails, list):
+                return Response(
+                    {"error": "Provide an 'emails' list or a CSV 'file'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        # Keep the teacher's order, drop blanks and repeats
+        emails = list(dict.fromkeys(str(email).strip() for email in emails if str(email).strip()))
+        if not emails:
+            return Response({"error": "No emails provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(emails) > self.MAX_EMAILS:
+            return Response(
+                {"error": f"At most {self.MAX_EMAILS} emails can be added at once"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # One IN query resolves every student, one more finds their current enrollments
+        students = {
+            student['email']: student
+            for student in User.objects.filter(email__in=emails, user_type='student').values('id', 'username', 'email')
+        }
+        Enrollment = Class.students.through
+        # Pairs, not a dict: a student already in several classes must still be found in this one
+        enrollments = set(
+            Enrollment.objects.filter(user_id__in=[student['id'] for student in students.values()])
+            .values_list('user_id', 'class_id')
+        )
+        enrolled_ids = {user_id for user_id, _ in enrollments}
+
+        results = []
+        to_add = []
+        for email in emails:
+            student = students.get(email)
+            if not student:
+                results.append({"email": email, "status": "not_found"})
+            elif (student['id'], class_obj.id) in enrollments:
+                results.append({"email": email, "status": "already_in_class", "student": student})
+            elif student['id'] in enrolled_ids:
+                # Same rule as AddStudentToClassView: a student belongs to one class
+                results.append({"email": email, "status": "enrolled_in_another_class", "student": student})
+            else:
+                to_add.append(Enrollment(class_id=class_obj.id, user_id=student['id']))
+                results.append({"email": email, "status": "added", "student": student})
+
+        with transaction.atomic():
+            Enrollment.objects.bulk_create(to_add, ignore_conflicts=True)
+            GalistLeaderboardBucket.add_class_members(class_obj.id, [enrollment.user_id for enrollment in to_add])
+        if to_add:
+            invalidate_class_boards(class_obj.id)
+
+        return Response({
+            "success": True,
+            "added": len(to_add),
+            "results": results
+        })
+
+    def read_csv_emails(self, uploaded_file):
+        """Return the first email-looking cell of each CSV row"""
+        lines = (line.decode('utf-8-sig', errors='replace') for line in uploaded_file)
+        return [
+            next((cell for cell in row if '@' in cell), '')
+            for row in csv.reader(lines)
+        ]
+
 class RemoveStudentFromClassView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
@@ -406,7 +850,7 @@ class RemoveStudentFromClassView(APIView):
         try:
             # Verify the class exists and user is the teacher
             class_obj = Class.objects.get(id=class_id)
-            if request.user != class_obj.teacher:
+            if request.user.id != class_obj.teacher_id:
                 return Response(
                     {"error": "You don't have permission to remove students from this class"},
                     status=status.HTTP_403_FORBIDDEN
@@ -422,14 +866,17 @@ class RemoveStudentFromClassView(APIView):
                 )
                 
             # Check if student is in this class
-            if student not in class_obj.students.all():
+            if not class_obj.students.filter(id=student.id).exists():
                 return Response(
                     {"error": "This student is not enrolled in this class"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
                 
-            # Remove student from class
-            class_obj.students.remove(student)
+            # Remove student from class, and from its leaderboards
+            with transaction.atomic():
+                class_obj.students.remove(student)
+                GalistLeaderboardBucket.remove_class_members(class_obj.id, [student.id])
+            invalidate_class_boards(class_obj.id)
             
             return Response({
                 "success": True,
@@ -447,14 +894,81 @@ class GalistLeaderboardView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        # Get top 10 entries (or specify limit via query param)
-        limit = int(request.query_params.get('limit', 10))
+        # Top 10 entries by default; `limit` and `cursor` page through the rest
+        paginator = GalistKeysetPagination()
+        window = request.query_params.get('window')
+        class_id = request.query_params.get('class_id')
         
-        # Get leaderboard entries ordered by score (desc) then time (asc)
-        leaderboard = GalistLeaderboard.objects.select_related('user').order_by('-score', 'time_elapsed')[:limit]
-        
-        serializer = GalistLeaderboardSerializer(leaderboard, many=True, context={'request': request})
-        return Response(serializer.data)
+        etag_parts = []
+        if window or class_id:
+            # Daily/weekly/class rankings, read from the rollup buckets
+            period = window or GalistLeaderboardBucket.PERIOD_ALL
+            buckets = self.get_bucket_queryset(request, period, class_id)
+            if isinstance(buckets, Response):
+                return buckets
+            queryset = buckets.select_related('entry__user')
+            board = BEST_BOARD if queryset.model is GalistBestScore else bucket_board(period, class_id and int(class_id))
+            # A new day or week starts a new bucket without any write
+            etag_parts.append(GalistLeaderboardBucket.period_start_for(period))
+        elif request.query_params.get('mode') == 'best':
+            # One row per player, read from the materialized best-score table
+            queryset = GalistBestScore.objects.select_related('entry__user')
+            board = BEST_BOARD
+        else:
+            # Get leaderboard entries ordered by score (desc) then time (asc)
+            queryset = GalistLeaderboard.objects.select_related('user')
+            board = ENTRIES_BOARD
+
+        etag = make_etag(get_version(LEADERBOARD_VERSION_KEY), *etag_parts)
+        response = not_modified(request, etag)
+        if response:
+            return response
+
+        if paginator.cursor_query_param in request.query_params:
+            # Deeper pages are rarely requested and are read straight from the database
+            try:
+                rows, next_cursor = paginator.paginate_queryset(queryset, request)
+            except InvalidCursor as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            leaderboard = rows if queryset.model is GalistLeaderboard else [row.entry for row in rows]
+            data = serialize_leaderboard_entries(leaderboard, request)
+        else:
+            # Every dashboard asks for the same first page; it is served already serialized
+            data, next_cursor = get_first_page(board, queryset, request, paginator.get_page_size(request))
+
+        # The body stays a plain list; the cursor for the next page travels in a header
+        headers = conditional_headers(etag)
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        return Response(data, headers=headers)
+
+    def get_bucket_queryset(self, request, period, class_id):
+        """Return the bucket rows for one window, or an error Response"""
+        if period not in dict(GalistLeaderboardBucket.PERIOD_CHOICES):
+            return Response({"error": "window must be one of day, week or all"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if class_id:
+            try:
+                class_obj = Class.objects.get(id=int(class_id))
+            except (ValueError, Class.DoesNotExist):
+                return Response({"error": "Class not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            is_member = class_obj.teacher_id == request.user.id or \
+                class_obj.students.filter(id=request.user.id).exists()
+            if not is_member:
+                return Response(
+                    {"error": "You don't have permission to view this class's leaderboard"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+        elif period == GalistLeaderboardBucket.PERIOD_ALL:
+            # The global all-time ranking per player is the best-score table
+            return GalistBestScore.objects.all()
+
+        return GalistLeaderboardBucket.objects.filter(
+            period=period,
+            period_start=GalistLeaderboardBucket.period_start_for(period),
+            class_obj_id=int(class_id) if class_id else None,
+        )
 
 class GalistLeaderboardSubmitView(APIView):
     """Submit a new leaderboard score"""
@@ -464,32 +978,96 @@ class GalistLeaderboardSubmitView(APIView):
         serializer = GalistLeaderboardCreateSerializer(data=request.data, context={'request': request})
         
         if serializer.is_valid():
-            entry = serializer.save()
+            class_ids = list(request.user.enrolled_classes.values_list('id', flat=True))
+            with transaction.atomic():
+                entry = serializer.save()
+                is_personal_best = GalistBestScore.record(entry)
+                GalistLeaderboardBucket.record(entry, class_ids)
+                bump_leaderboard_version()
+                # Only the cached boards this score ranks into are dropped
+                transaction.on_commit(lambda: invalidate_for_entry(entry, is_personal_best, class_ids))
             
             # Return the created entry with full details
             response_serializer = GalistLeaderboardSerializer(entry, context={'request': request})
+            # The player's standing on the best-per-player board: counting ranks over the much
+            # larger attempts table on every submit would put an O(rank) scan on the write path
+            rank = GalistBestScore.objects.get(user_id=entry.user_id).get_rank()
             
             return Response({
                 'success': True,
                 'message': 'Score submitted successfully',
-                'entry': response_serializer.data
+                'entry': response_serializer.data,
+                'rank': rank,
+                'is_personal_best': is_personal_best
             }, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class GalistLeaderboardRankView(APIView):
+    """Get the current user's leaderboard rank and the entries around it.
+
+    Ranks are among players (one best score each) by default. ?mode=attempts
+    ranks the user's best attempt among every entry instead; that counts over
+    the whole entry table, so it gets slower as the table grows.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            radius = min(max(int(request.query_params.get('around', 2)), 0), 10)
+        except ValueError:
+            return Response({"error": "Invalid around value"}, status=status.HTTP_400_BAD_REQUEST)
+
+        mode = request.query_params.get('mode', 'best')
+        if mode not in ('best', 'attempts'):
+            return Response({"error": "mode must be best or attempts"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if mode == 'best':
+            # Rank among players, using the materialized best-score table (one row per player)
+            best = GalistBestScore.objects.filter(user=request.user).select_related('entry__user').first()
+            if not best:
+                return Response({'rank': None, 'entry': None, 'above': [], 'below': []})
+
+            above, below = best.get_neighbours(radius, GalistBestScore.objects.select_related('entry__user'))
+            best_entry, rank = best.entry, best.get_rank()
+            above = [row.entry for row in above]
+            below = [row.entry for row in below]
+        else:
+            # The user's best entry is the first of their rows in leaderboard order
+            best_entry = GalistLeaderboard.objects.filter(user=request.user).select_related('user').ranked().first()
+            if not best_entry:
+                return Response({'rank': None, 'entry': None, 'above': [], 'below': []})
+
+            above, below = best_entry.get_neighbours(radius, GalistLeaderboard.objects.select_related('user'))
+            rank = best_entry.get_rank()
+
+        return Response({
+            'rank': rank,
+            'entry': serialize_leaderboard_entries([best_entry], request)[0],
+            'above': serialize_leaderboard_entries(above, request),
+            'below': serialize_leaderboard_entries(below, request)
+        })
+
 class UserGalistScoresView(APIView):
     """Get current user's leaderboard entries"""
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        scores = GalistLeaderboard.objects.filter(user=request.user).order_by('-score', 'time_elapsed')
-        serializer = GalistLeaderboardSerializer(scores, many=True, context={'request': request})
+        scores = GalistLeaderboard.objects.filter(user=request.user).select_related('user')
+        
+        try:
+            page, next_cursor = GalistKeysetPagination().paginate_queryset(scores, request)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get user's best score
-        best_score = scores.first() if scores.exists() else None
+        # Summary comes from the user's maintained stats row, not from their history
+        stats = GalistBestScore.objects.filter(user=request.user).select_related('entry__user').first()
         
         return Response({
-            'scores': serializer.data,
-            'best_score': GalistLeaderboardSerializer(best_score, context={'request': request}).data if best_score else None,
-            'total_attempts': scores.count()
+            'scores': serialize_leaderboard_entries(page, request),
+            'next_cursor': next_cursor,
+            'best_score': serialize_leaderboard_entries([stats.entry], request)[0] if stats else None,
+            'best_time': stats.time_elapsed if stats else None,
+            'average_score': stats.average_score if stats else 0,
+            'total_attempts': stats.attempts if stats else 0
         })
\ No newline at end of file
@@ -3,6 +3,10 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run the API through this app (e.g. ``uvicorn backend.asgi:application``) to
+serve the /api/user/events/ heart stream; each open stream is then a cheap
+coroutine instead of a blocked WSGI worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
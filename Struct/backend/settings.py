@@ -14,6 +14,7 @@ from pathlib import Path
 import os
 from datetime import timedelta
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,6 +24,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Background workers that render profile photo thumbnails after an upload
+PHOTO_THUMBNAIL_WORKERS = int(os.getenv("PHOTO_THUMBNAIL_WORKERS", "2"))
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
@@ -41,11 +45,23 @@ AUTH_USER_MODEL = 'api.User'
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Password hashing runs on a bounded thread pool so login storms don't block other requests
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# Opt-in stateless auth: LoginView returns signed access/refresh tokens (sent as
+# "Authorization: Bearer <access>") instead of a database-backed Token. Logout
+# blacklists the user's refresh tokens; access tokens last out their
+# ACCESS_TOKEN_LIFETIME.
+AUTH_STATELESS_TOKENS = os.getenv("AUTH_STATELESS_TOKENS", "false").lower() == "true"
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+        'api.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -53,9 +69,48 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Token -> user lookups are cached so authenticated requests skip the auth query.
+# With the default local-memory cache each process keeps its own bounded copy;
+# point AUTH_TOKEN_CACHE at a shared cache (Redis/Memcached) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'auth_tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth-tokens',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000"))},
+    },
+    # Serialized leaderboard pages (see api/leaderboard_cache.py). Any backend works, e.g.
+    # LEADERBOARD_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache with a directory
+    # as LEADERBOARD_CACHE_LOCATION to share it between the processes on one host.
+    'galist_leaderboard': {
+        'BACKEND': os.getenv("LEADERBOARD_CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("LEADERBOARD_CACHE_LOCATION", 'galist-leaderboard'),
+    },
+}
+AUTH_TOKEN_CACHE = 'auth_tokens'
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv("AUTH_TOKEN_CACHE_TIMEOUT", "60"))  # seconds
+# Version stamps behind the ETags of profile, hearts and leaderboard responses (see api/versions.py).
+# Point this at a cache shared by all processes (e.g. Redis) when running more than one; the
+# timeout bounds how long a write from another process can still be answered with 304.
+VERSION_CACHE = 'default'
+VERSION_CACHE_TIMEOUT = int(os.getenv("VERSION_CACHE_TIMEOUT", "60"))  # seconds
+LEADERBOARD_CACHE = 'galist_leaderboard'
+LEADERBOARD_CACHE_TIMEOUT = int(os.getenv("LEADERBOARD_CACHE_TIMEOUT", "60"))  # seconds
+
 # Enable CORS if your frontend is served separately
 CORS_ALLOW_ALL_ORIGINS = True  # For development only; restrict in production
 
+# Optional write-behind mode for quiz points (see api/points_buffer.py)
+POINTS_WRITE_BEHIND = os.getenv("POINTS_WRITE_BEHIND", "false").lower() == "true"
+POINTS_FLUSH_INTERVAL = float(os.getenv("POINTS_FLUSH_INTERVAL", "2"))  # seconds
+POINTS_JOURNAL_DIR = os.getenv("POINTS_JOURNAL_DIR", os.path.join(BASE_DIR, 'points_journal'))
+POINTS_JOURNAL_FSYNC = os.getenv("POINTS_JOURNAL_FSYNC", "true").lower() == "true"
+
+# Let the frontend read the leaderboard pagination cursor
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -67,6 +122,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
+    'rest_framework_simplejwt.token_blacklist',  # Logout revokes refresh tokens (AUTH_STATELESS_TOKENS)
     'corsheaders',
     'api',
 ]
@@ -156,8 +212,36 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PWD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
+        # Persistent connections: reuse each thread's connection for this many seconds
+        # instead of reconnecting per request, and ping it before reuse
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "true").lower() == "true",
     }
 }
+
+# Native connection pool (needs psycopg 3 with psycopg_pool). Preferred under ASGI,
+# where per-thread persistent connections are not reused reliably. max_size caps
+# the number of backends each process opens; pool stats are at /api/metrics/db-pool/.
+DB_POOL = os.getenv("DB_POOL", "false").lower() == "true"
+if DB_POOL:
+    try:
+        from psycopg_pool import ConnectionPool
+    except ImportError as e:
+        raise ImproperlyConfigured('DB_POOL needs psycopg 3 with its pool extra: pip install "psycopg[binary,pool]"') from e
+
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # Pooled connections are returned to the pool instead
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),  # seconds to wait for a free connection
+            "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")),
+            "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "600")),
+        },
+    }
+    if DATABASES["default"]["CONN_HEALTH_CHECKS"]:
+        DATABASES["default"]["OPTIONS"]["pool"]["check"] = ConnectionPool.check_connection
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -4,6 +4,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import HttpResponse
+from django.views.static import serve
+from api.storage import CONTENT_ADDRESSED_PREFIX, IMMUTABLE_CACHE_CONTROL
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -12,6 +14,14 @@ urlpatterns = [
 ]
 
 
+def serve_media(request, path, **kwargs):
+    response = serve(request, path, **kwargs)
+    # Content-addressed photos never change, so they can be cached forever
+    if path.startswith(CONTENT_ADDRESSED_PREFIX):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
 # Add this only for development
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
\ No newline at end of file